@@ -11,6 +11,7 @@ from sqlalchemy import MetaData
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 from flask_bootstrap import Bootstrap
+from app.profiler import SQLProfiler
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 if os.path.exists(dotenv_path):
@@ -31,13 +32,16 @@ login = LoginManager()
 login.login_message = 'Please log in to access this page'
 login.login_view = 'login'
 cache = Cache()
+profiler = SQLProfiler()
 
 from app.users import bp as users_bp
 from app.gallery import bp as gallery_bp
+from app.gallery.ingest import UploadRequest
 
 
 def create_app(config_class=Config):
     app = Flask(__name__, static_folder='static', static_url_path='')
+    app.request_class = UploadRequest
     app.config.from_object(config_class)
     db.init_app(app)
     migrate.init_app(app, db, render_as_batch=True)
@@ -45,6 +49,7 @@ def create_app(config_class=Config):
     bootstrap.init_app(app)
     login.init_app(app)
     cache.init_app(app)
+    profiler.init_app(app)
     app.register_blueprint(users_bp)
     app.register_blueprint(gallery_bp)
     return app
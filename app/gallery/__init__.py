@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('gallery', __name__)
 
-from app.gallery import views, models, forms
+from app.gallery import views, models, forms, commands, search, fragments
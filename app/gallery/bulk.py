@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from app import db
+from app.gallery import search
+from app.gallery.models import artworks_tags, Artwork, Client, Offer, Tag
+
+SOFT_DELETE = {'artwork': Artwork, 'client': Client, 'offer': Offer, 'tag': Tag}
+
+
+def selection(cls, ids=None, criteria=()):
+    select = db.select(cls.id).where(cls.no_active.is_(False), *criteria)
+    if ids is not None:
+        select = select.where(cls.id.in_(ids))
+    return select.correlate(None)
+
+
+def active_tags(tag_ids):
+    return db.select(Tag.id).where(Tag.id.in_(tag_ids), Tag.no_active.is_(False)).correlate(None)
+
+
+def is_linked(artwork_id, tag_id):
+    return (db.select(artworks_tags.c.artwork_id)
+            .where(artworks_tags.c.artwork_id == artwork_id,
+                   artworks_tags.c.tag_id == tag_id)
+            .exists())
+
+
+def update(statement):
+    return db.session.execute(statement.execution_options(synchronize_session=False)).rowcount
+
+
+def add_tags(artworks, tag_ids):
+    pairs = (db.select(Artwork.id, Tag.id).select_from(Artwork)
+             .join(Tag, Tag.id.in_(active_tags(tag_ids)))
+             .where(Artwork.id.in_(artworks), ~is_linked(Artwork.id, Tag.id))
+             .correlate(None))
+    touched = update(db.update(Artwork)
+                     .where(Artwork.id.in_(pairs.with_only_columns(Artwork.id).distinct()))
+                     .values(timestamp_update=datetime.utcnow()))
+    linked = db.session.execute(db.insert(artworks_tags)
+                                .from_select(['artwork_id', 'tag_id'], pairs)).rowcount
+    db.session.execute(Tag.count_update(tag_ids))
+    db.session.commit()
+    return {'artworks': touched, 'links': linked}
+
+
+def remove_tags(artworks, tag_ids):
+    now = datetime.utcnow()
+    linked = (db.select(artworks_tags.c.artwork_id)
+              .where(artworks_tags.c.artwork_id == Artwork.id,
+                     artworks_tags.c.tag_id.in_(tag_ids))
+              .exists())
+    touched = update(db.update(Artwork)
+                     .where(Artwork.id.in_(artworks), linked)
+                     .values(timestamp_update=now))
+    unlinked = db.session.execute(db.delete(artworks_tags)
+                                  .where(artworks_tags.c.artwork_id.in_(artworks),
+                                         artworks_tags.c.tag_id.in_(tag_ids))).rowcount
+    db.session.execute(Tag.count_update(tag_ids))
+    db.session.commit()
+    return {'artworks': touched, 'links': unlinked}
+
+
+def change_offer_status(offers, status_id):
+    updated = update(db.update(Offer)
+                     .where(Offer.id.in_(offers),
+                            db.or_(Offer.status_id.is_(None), Offer.status_id != status_id))
+                     .values(status_id=status_id, timestamp_update=datetime.utcnow()))
+    db.session.commit()
+    return {'offers': updated}
+
+
+def soft_delete(entity, ids):
+    cls = SOFT_DELETE[entity]
+    connection = db.session.connection()
+    tag_ids = None
+    if cls is Artwork:
+        tag_ids = db.session.scalars(db.select(artworks_tags.c.tag_id)
+                                     .where(artworks_tags.c.artwork_id.in_(ids))
+                                     .distinct()).all()
+    if entity in search.SEARCHABLE and search.is_supported(connection):
+        search.remove_selection(connection, entity, ids)
+    deleted = update(db.update(cls)
+                     .where(cls.id.in_(ids))
+                     .values(no_active=True, timestamp_update=datetime.utcnow()))
+    if tag_ids:
+        db.session.execute(Tag.count_update(tag_ids))
+    db.session.commit()
+    return {entity + 's': deleted}
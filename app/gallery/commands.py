@@ -0,0 +1,160 @@
+import os
+import time
+import hashlib
+
+import click
+
+from app import db
+from app.gallery import bp, tasks, storage, pdf, search, plans, export
+from app.gallery.importer import Importer, count_records
+from app.gallery.models import Artwork, Attachment, Tag
+
+
+@bp.cli.command('set-main-images')
+def set_main_images():
+    main_id = (db.select(Attachment.id)
+               .where(Attachment.artwork_id == Artwork.id,
+                      Attachment.no_active.is_(False))
+               .order_by(Attachment.main_image.desc(), Attachment.id)
+               .limit(1)
+               .scalar_subquery())
+    result = db.session.execute(db.update(Artwork)
+                                .where(Artwork.main_attachment_id.is_(None))
+                                .values(main_attachment_id=main_id))
+    db.session.commit()
+    click.echo('Main images set for {} artworks'.format(result.rowcount))
+
+
+@bp.cli.command('process-attachments')
+@click.option('--include-failed', is_flag=True, help='Retry failed attachments too.')
+def process_attachments(include_failed):
+    futures = tasks.enqueue_pending(include_failed=include_failed)
+    done = sum(1 for future in futures if future.result())
+    click.echo('Processed {} of {} attachments'.format(done, len(futures)))
+
+
+@bp.cli.command('hash-attachments')
+@click.option('--batch-size', type=int, default=100, help='Attachments per transaction.')
+def hash_attachments(batch_size):
+    hashed = skipped = 0
+    last_id = 0
+    while True:
+        items = (Attachment.query
+                 .filter(Attachment.hash.is_(None), Attachment.state == 'ready',
+                         Attachment.id > last_id)
+                 .order_by(Attachment.id)
+                 .limit(batch_size)
+                 .all())
+        if not items:
+            break
+        last_id = items[-1].id
+        for attachment in items:
+            if attachment.is_video:
+                skipped += 1
+                continue
+            sha256 = hashlib.sha256()
+            for chunk in storage.iter_object(attachment.path, attachment.name):
+                sha256.update(chunk)
+            attachment.hash = sha256.hexdigest()
+            hashed += 1
+        db.session.commit()
+    click.echo('Hashed {} attachments, skipped {} videos'.format(hashed, skipped))
+
+
+@bp.cli.command('export-catalog')
+@click.option('--type-id', type=int, help='Artwork type to export.')
+@click.option('--tag-id', 'tag_ids', type=int, multiple=True, help='Tag filter, repeatable.')
+@click.option('--status-id', type=int, help='Only artworks with an offer in this status.')
+@click.option('--format', 'output_format', type=click.Choice(['pdf', 'zip']), default='pdf')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=50,
+              help='Artworks per PDF chunk (zip only).')
+@click.argument('output', type=click.File('wb'))
+def export_catalog(type_id, tag_ids, status_id, output_format, chunk_size, output):
+    query = pdf.catalog_query(type_id=type_id, tag_ids=tag_ids, status_id=status_id)
+    total = query.count()
+    start = time.perf_counter()
+    for data in pdf.export_catalog(query, output_format=output_format, chunk_size=chunk_size):
+        output.write(data)
+    elapsed = time.perf_counter() - start
+    click.echo('Exported {} artworks in {:.2f}s ({:.1f} artworks/s)'.format(
+        total, elapsed, total / elapsed if elapsed else 0))
+
+
+@bp.cli.command('search-reindex')
+@click.option('--batch-size', type=int, default=1000)
+def search_reindex(batch_size):
+    total = search.rebuild_index(batch_size=batch_size)
+    click.echo('Indexed {} documents'.format(total))
+
+
+@bp.cli.command('recount-tags')
+def recount_tags():
+    total = Tag.recount()
+    click.echo('Recounted {} tags'.format(total))
+
+
+@bp.cli.command('explain-queries')
+@click.option('--table', 'tables', multiple=True, help='Only check these tables, repeatable.')
+@click.option('--verbose', is_flag=True, help='Print every query plan.')
+def explain_queries(tables, verbose):
+    models = [m for m in plans.entity_models() if not tables or m.__tablename__ in tables]
+    try:
+        results = plans.explain_shapes(models)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    failures = 0
+    for table, shape, lines, scans in results:
+        if scans:
+            failures += 1
+        if scans or verbose:
+            click.echo('{} {}: {}'.format('FAIL' if scans else 'ok', table, shape))
+            for line in lines:
+                click.echo('    ' + line)
+    click.echo('Checked {} query shapes, {} with sequential scans'.format(len(results), failures))
+    if failures:
+        raise SystemExit(1)
+
+
+@bp.cli.command('import')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--media-dir', type=click.Path(exists=True, file_okay=False),
+              help='Directory the manifest file paths are relative to.')
+@click.option('--state', 'state_path', type=click.Path(dir_okay=False),
+              help='Resume file, defaults to MANIFEST.state.json.')
+@click.option('--batch-size', type=int, default=500, help='Artworks per transaction.')
+def import_collection(manifest, media_dir, state_path, batch_size):
+    importer = Importer(manifest, media_dir or os.path.dirname(os.path.abspath(manifest)),
+                        state_path=state_path, batch_size=batch_size)
+    total = count_records(manifest)
+    start = time.perf_counter()
+    skipped = importer.state.records
+
+    def progress(importer):
+        elapsed = time.perf_counter() - start
+        stats = importer.stats
+        click.echo('{}/{} records, {} attachments ({} deduplicated, {} missing), '
+                   '{} processed, {} failed, {} queued | {:.1f} artworks/s, {:.1f} MB/s'.format(
+                       importer.state.records, total, stats['attachments'], stats['deduplicated'],
+                       stats['missing'], stats['processed'], stats['failed'],
+                       len(importer.futures),
+                       stats['artworks'] / elapsed if elapsed else 0,
+                       stats['bytes'] / elapsed / 1e6 if elapsed else 0))
+
+    if skipped:
+        click.echo('Resuming after {} records, {} media files pending'.format(
+            skipped, len(importer.state.pending)))
+    stats = importer.run(progress=progress)
+    click.echo('Imported {} artworks and {} attachments in {:.1f}s'.format(
+        stats['artworks'], stats['attachments'], time.perf_counter() - start))
+
+
+@bp.cli.command('export')
+@click.argument('entity', type=click.Choice(sorted(export.QUERIES)))
+@click.argument('output', type=click.File('w', encoding='utf-8'))
+@click.option('--format', 'output_format', type=click.Choice(sorted(export.FORMATS)), default='csv')
+@click.option('--batch-size', type=click.IntRange(min=1), help='Rows fetched per round trip.')
+def export_data(entity, output, output_format, batch_size):
+    start = time.perf_counter()
+    for data in export.export_rows(entity, output_format, batch_size=batch_size):
+        output.write(data)
+    click.echo('Exported {} in {:.2f}s'.format(entity, time.perf_counter() - start))
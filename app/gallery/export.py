@@ -0,0 +1,72 @@
+import io
+import csv
+import json
+
+from flask import current_app
+
+from app import db
+from app.gallery.models import Artwork, ArtworkType, Client, Offer, Status
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def offers_query():
+    return (db.select(Offer.id, Offer.name, Offer.price, Offer.info,
+                      Client.name.label('client'), Client.phone.label('client_phone'),
+                      Artwork.name.label('artwork'), Artwork.author.label('artwork_author'),
+                      Status.name.label('status'),
+                      Offer.timestamp_create, Offer.timestamp_update)
+            .join(Client, Offer.client_id == Client.id)
+            .join(Artwork, Offer.artwork_id == Artwork.id)
+            .outerjoin(Status, Offer.status_id == Status.id)
+            .where(Offer.no_active.is_(False))
+            .order_by(Offer.id))
+
+
+def clients_query():
+    return (db.select(Client.id, Client.name, Client.phone, Client.birthday, Client.info,
+                      Client.timestamp_create, Client.timestamp_update)
+            .where(Client.no_active.is_(False))
+            .order_by(Client.id))
+
+
+def artworks_query():
+    return (db.select(Artwork.id, Artwork.name, ArtworkType.name.label('type'), Artwork.author,
+                      Artwork.year, Artwork.buy_price, Artwork.info,
+                      Artwork.timestamp_create, Artwork.timestamp_update)
+            .join(ArtworkType, Artwork.type_id == ArtworkType.id)
+            .where(Artwork.no_active.is_(False))
+            .order_by(Artwork.id))
+
+
+QUERIES = {'offers': offers_query, 'clients': clients_query, 'artworks': artworks_query}
+
+
+def encode_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def export_rows(entity, output_format, batch_size=None):
+    batch_size = batch_size or current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    result = db.session.execute(QUERIES[entity]().execution_options(yield_per=batch_size))
+    columns = list(result.keys())
+    buffer = io.StringIO()
+    if output_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+    for rows in result.partitions():
+        for row in rows:
+            if output_format == 'csv':
+                writer.writerow([encode_value(v) for v in row])
+            else:
+                buffer.write(json.dumps({c: encode_value(v) for c, v in zip(columns, row)},
+                                        ensure_ascii=False))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+    result.close()
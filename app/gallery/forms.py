@@ -1,7 +1,30 @@
 from flask_wtf import FlaskForm
 from wtforms import (StringField, TelField, DateField, SubmitField, TextAreaField,
                      FileField, IntegerField, SelectField, BooleanField)
-from wtforms.validators import Optional, DataRequired, Length, InputRequired
+from wtforms.validators import Optional, DataRequired, Length, InputRequired, ValidationError
+
+from app.gallery.models import Client, Artwork
+
+
+class Exists:
+    def __init__(self, model, message='Select an existing item'):
+        self.model = model
+        self.message = message
+
+    def __call__(self, form, field):
+        try:
+            id = int(field.data)
+        except (TypeError, ValueError):
+            raise ValidationError(self.message)
+        if not self.model.get_object(id, mode_404=False):
+            raise ValidationError(self.message)
+
+
+class LookupField(SelectField):
+    def __init__(self, label=None, validators=None, model=None, **kwargs):
+        render_kw = {'data-choices': model.__tablename__, **kwargs.pop('render_kw', {})}
+        super().__init__(label, validators=(validators or []) + [Exists(model)],
+                         validate_choice=False, render_kw=render_kw, **kwargs)
 
 
 class UploadForm(FlaskForm):
@@ -68,6 +91,11 @@ class AttachmentForm(FlaskForm):
     cancel = SubmitField('Cancel', render_kw={'formnovalidate': True})
 
 
+class ArtworkTagForm(FlaskForm):
+    tag_id = SelectField('Tag', choices=[], validators=[InputRequired()])
+    submit = SubmitField('Add tag')
+
+
 class SelectTemplateForm(FlaskForm):
     template = SelectField('Template', choices=[('', '-Select-'), (0, 'Template 1'), (1, 'Template 2')],
                            validators=[InputRequired()])
@@ -76,8 +104,8 @@ class SelectTemplateForm(FlaskForm):
 
 
 class OfferForm(FlaskForm):
-    artwork_id = SelectField('Artwork', choices=[], validators=[InputRequired()])
-    client_id = SelectField('Client', choices=[], validators=[InputRequired()])
+    artwork_id = LookupField('Artwork', choices=[], validators=[InputRequired()], model=Artwork)
+    client_id = LookupField('Client', choices=[], validators=[InputRequired()], model=Client)
     price = IntegerField('Buy price')
     status_id = SelectField('Status', choices=[], validators=[InputRequired()])
     info = TextAreaField('Info', validators=[Length(max=200)])
@@ -86,6 +114,9 @@ class OfferForm(FlaskForm):
 
 
 class SearchForm(FlaskForm):
+    class Meta:
+        csrf = False
+
     feature_id = SelectField('Feature', choices=[], validators=[InputRequired()])
     value = StringField('Value', validators=[DataRequired()])
     submit = SubmitField('Search')
@@ -0,0 +1,85 @@
+from flask import current_app
+from markupsafe import Markup
+
+from app import db, cache
+from app.gallery.models import Artwork, Attachment, Feature, FeaturesValue
+
+KINDS = ['card', 'artwork']
+
+
+def fragment_key(kind, artwork_id, timestamp):
+    return 'fragment:{}:{}:{}'.format(kind, artwork_id,
+                                      timestamp.isoformat() if timestamp else '')
+
+
+def get_timeout():
+    config = current_app.config
+    return config.get('FRAGMENT_CACHE_TIMEOUT', config.get('AWS_PRESIGN_MARGIN', 300))
+
+
+def render_many(kind, items, render):
+    keys = [fragment_key(kind, i.id, i.timestamp_update) for i in items]
+    cached = cache.get_many(*keys) if keys else []
+    missing = [i for i, html in zip(items, cached) if html is None]
+    rendered = render(missing) if missing else {}
+    if rendered:
+        cache.set_many({fragment_key(kind, i.id, i.timestamp_update): rendered[i.id]
+                        for i in missing}, timeout=get_timeout())
+    return [Markup(html if html is not None else rendered[i.id])
+            for i, html in zip(items, cached)]
+
+
+def render_one(kind, item, render):
+    return render_many(kind, [item], lambda items: {item.id: render()})[0]
+
+
+def artwork_keys(artwork_id, timestamp):
+    return [fragment_key(kind, artwork_id, timestamp) for kind in KINDS]
+
+
+def pending(target, name):
+    return db.inspect(target).session.info.setdefault(name, set())
+
+
+def _invalidate_artwork(mapper, connection, target):
+    pending(target, 'fragment_keys').update(artwork_keys(target.id, target.timestamp_update))
+
+
+def _invalidate_parent(mapper, connection, target):
+    if target.artwork_id is None:
+        return
+    timestamp = connection.execute(db.select(Artwork.timestamp_update)
+                                   .where(Artwork.id == target.artwork_id)).scalar()
+    pending(target, 'fragment_keys').update(artwork_keys(target.artwork_id, timestamp))
+
+
+def _invalidate_type(mapper, connection, target):
+    pending(target, 'fragment_types').add(target.type_id)
+
+
+def _after_commit(session):
+    keys = session.info.pop('fragment_keys', set())
+    type_ids = session.info.pop('fragment_types', set())
+    if type_ids:
+        with db.engine.connect() as connection:
+            rows = connection.execute(db.select(Artwork.id, Artwork.timestamp_update)
+                                      .where(Artwork.type_id.in_(type_ids)))
+            keys.update(fragment_key('artwork', r.id, r.timestamp_update) for r in rows)
+    if keys:
+        cache.delete_many(*keys)
+
+
+def _after_rollback(session):
+    session.info.pop('fragment_keys', None)
+    session.info.pop('fragment_types', None)
+
+
+db.event.listen(Artwork, 'after_update', _invalidate_artwork)
+db.event.listen(Artwork, 'after_delete', _invalidate_artwork)
+for model in (Attachment, FeaturesValue):
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        db.event.listen(model, name, _invalidate_parent)
+for name in ('after_insert', 'after_update', 'after_delete'):
+    db.event.listen(Feature, name, _invalidate_type)
+db.event.listen(db.session, 'after_commit', _after_commit)
+db.event.listen(db.session, 'after_rollback', _after_rollback)
@@ -0,0 +1,260 @@
+import os
+import csv
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from flask import current_app
+
+from app import db
+from app.gallery import search, tasks
+from app.gallery.media import is_video
+from app.gallery.models import (artworks_tags, Artwork, ArtworkType, Attachment, Feature,
+                                FeaturesValue, Tag)
+from app.gallery.storage import default_bucket
+
+ARTWORK_FIELDS = ['name', 'author', 'year', 'buy_price', 'info']
+FEATURE_PREFIX = 'feature:'
+
+
+def split_list(value):
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in (value or '').split(';') if v.strip()]
+
+
+def read_manifest(path):
+    with open(path, encoding='utf-8') as file:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(file):
+                features = {k[len(FEATURE_PREFIX):]: v for k, v in row.items()
+                            if k and k.startswith(FEATURE_PREFIX) and v}
+                yield dict(row, features=features)
+        elif path.endswith('.json'):
+            yield from json.load(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def count_records(path):
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as file:
+            return len(json.load(file))
+    with open(path, encoding='utf-8') as file:
+        lines = sum(1 for line in file if line.strip())
+    return lines - 1 if path.endswith('.csv') else lines
+
+
+def file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ImportState:
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self.pending = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                data = json.load(file)
+            self.records = data['records']
+            self.pending = {int(k): v for k, v in data['pending'].items()}
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump({'records': self.records, 'pending': self.pending}, file)
+        os.replace(temp_path, self.path)
+
+
+class Lookup:
+    def __init__(self):
+        self.types = {t.name: t.id for t in ArtworkType.query.filter_by(no_active=False)}
+        self.tags = {t.name: t.id for t in Tag.query.filter_by(no_active=False)}
+        self.features = {(f.type_id, f.name): f.id
+                         for f in Feature.query.filter_by(no_active=False)}
+
+    def get_or_create(self, cache, key, model, **values):
+        if key not in cache:
+            obj = model(**values)
+            db.session.add(obj)
+            db.session.flush()
+            cache[key] = obj.id
+        return cache[key]
+
+    def type_id(self, record):
+        if record.get('type_id'):
+            return int(record['type_id'])
+        name = record.get('type') or 'Default'
+        return self.get_or_create(self.types, name, ArtworkType, name=name)
+
+    def tag_id(self, name):
+        return self.get_or_create(self.tags, name, Tag, name=name)
+
+    def feature_id(self, type_id, name):
+        return self.get_or_create(self.features, (type_id, name), Feature,
+                                  type_id=type_id, name=name)
+
+
+class Importer:
+    def __init__(self, manifest, media_dir, state_path=None, batch_size=500):
+        self.manifest = manifest
+        self.media_dir = media_dir
+        self.batch_size = batch_size
+        self.state = ImportState(state_path or manifest + '.state.json')
+        self.lookup = None
+        self.futures = {}
+        self.stats = {'artworks': 0, 'attachments': 0, 'deduplicated': 0, 'missing': 0,
+                      'processed': 0, 'failed': 0, 'bytes': 0}
+        config = current_app.config
+        self.extensions = config.get('UPLOAD_EXTENSIONS')
+        self.hash_workers = config.get('IMPORT_HASH_WORKERS', 8)
+        self.max_outstanding = config.get('IMPORT_MAX_OUTSTANDING', 64)
+
+    def media_path(self, name):
+        path = os.path.abspath(os.path.join(self.media_dir, name))
+        if not path.startswith(os.path.abspath(self.media_dir) + os.sep):
+            return None
+        extension = os.path.splitext(path)[1].lower()
+        if self.extensions and extension not in self.extensions:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def run(self, progress=None):
+        self.lookup = Lookup()
+        for attachment_id, path in list(self.state.pending.items()):
+            self.submit(attachment_id, path)
+        batch = []
+        for index, record in enumerate(read_manifest(self.manifest)):
+            if index < self.state.records:
+                continue
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                self.import_batch(batch)
+                batch = []
+                if progress:
+                    progress(self)
+        if batch:
+            self.import_batch(batch)
+        self.collect()
+        self.state.save()
+        if progress:
+            progress(self)
+        return self.stats
+
+    def import_batch(self, records):
+        files = [[(name, self.media_path(name)) for name in split_list(r.get('files'))]
+                 for r in records]
+        paths = [path for record_files in files for name, path in record_files if path]
+        self.stats['missing'] += sum(1 for record_files in files
+                                     for name, path in record_files if path is None)
+        with ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+            digests = dict(zip(paths, executor.map(file_digest, paths)))
+        originals = {a.hash: a for a in (Attachment.query
+                                         .filter(Attachment.hash.in_(set(digests.values())),
+                                                 Attachment.state == 'ready',
+                                                 Attachment.no_active.is_(False)))}
+
+        rows = []
+        for record in records:
+            row = {f: record.get(f) or None for f in ARTWORK_FIELDS}
+            row['name'] = row['name'] or ''
+            if row['buy_price'] is not None:
+                row['buy_price'] = int(row['buy_price'])
+            row['type_id'] = self.lookup.type_id(record)
+            rows.append(row)
+        artwork_ids = db.session.scalars(
+            db.insert(Artwork).returning(Artwork.id, sort_by_parameter_order=True), rows).all()
+
+        values = []
+        links = []
+        tag_counts = {}
+        attachments = []
+        for artwork_id, row, record, record_files in zip(artwork_ids, rows, records, files):
+            for name, value in (record.get('features') or {}).items():
+                values.append({'artwork_id': artwork_id,
+                               'feature_id': self.lookup.feature_id(row['type_id'], name),
+                               'value': str(value)})
+            for tag_id in {self.lookup.tag_id(name) for name in split_list(record.get('tags'))}:
+                links.append({'artwork_id': artwork_id, 'tag_id': tag_id})
+                tag_counts[tag_id] = tag_counts.get(tag_id, 0) + 1
+            for name, path in record_files:
+                if path is None:
+                    continue
+                attachment = {'artwork_id': artwork_id,
+                              'hash': digests[path],
+                              'main_image': False,
+                              'source': path}
+                original = originals.get(digests[path])
+                if original:
+                    attachment.update(name=original.name, path=original.path,
+                                      variants=original.variants, state='ready')
+                else:
+                    attachment.update(name=Attachment.create_file_name(
+                                          artwork_id, os.path.splitext(path)[1].lower()),
+                                      path=default_bucket(), state='pending')
+                attachments.append(attachment)
+        main = {}
+        for attachment in sorted(attachments, key=lambda a: is_video(a['name'])):
+            if attachment['artwork_id'] not in main:
+                attachment['main_image'] = True
+                main[attachment['artwork_id']] = attachment
+        if values:
+            db.session.execute(db.insert(FeaturesValue), values)
+        if links:
+            db.session.execute(db.insert(artworks_tags), links)
+            db.session.execute(db.update(Tag.__table__)
+                               .where(Tag.__table__.c.id == db.bindparam('tag_id'))
+                               .values(artwork_count=Tag.__table__.c.artwork_count +
+                                       db.bindparam('delta')),
+                               [{'tag_id': k, 'delta': v} for k, v in tag_counts.items()])
+        if attachments:
+            attachment_ids = db.session.scalars(
+                db.insert(Attachment).returning(Attachment.id, sort_by_parameter_order=True),
+                [{k: v for k, v in a.items() if k != 'source'} for a in attachments]).all()
+            for attachment, attachment_id in zip(attachments, attachment_ids):
+                attachment['id'] = attachment_id
+        if main:
+            db.session.execute(db.update(Artwork),
+                               [{'id': k, 'main_attachment_id': v['id']} for k, v in main.items()])
+        connection = db.session.connection()
+        if search.is_supported(connection):
+            search.index_many(connection, 'artwork',
+                              [Artwork(id=i, **row) for i, row in zip(artwork_ids, rows)])
+        db.session.commit()
+
+        pending = [a for a in attachments if a['state'] == 'pending']
+        self.state.records += len(records)
+        self.state.pending.update({a['id']: a['source'] for a in pending})
+        self.state.save()
+        self.stats['artworks'] += len(records)
+        self.stats['attachments'] += len(attachments)
+        self.stats['deduplicated'] += len(attachments) - len(pending)
+        for attachment in pending:
+            self.submit(attachment['id'], attachment['source'])
+
+    def submit(self, attachment_id, path):
+        self.collect(limit=self.max_outstanding - 1)
+        self.futures[tasks.enqueue(attachment_id, path=path)] = (attachment_id, path)
+
+    def collect(self, limit=0):
+        self.finish([f for f in self.futures if f.done()])
+        while len(self.futures) > limit:
+            done, not_done = wait(self.futures, return_when=FIRST_COMPLETED)
+            self.finish(done)
+
+    def finish(self, futures):
+        for future in futures:
+            attachment_id, path = self.futures.pop(future)
+            if future.exception() is None and future.result():
+                self.stats['processed'] += 1
+                self.stats['bytes'] += os.path.getsize(path)
+                self.state.pending.pop(attachment_id, None)
+            else:
+                self.stats['failed'] += 1
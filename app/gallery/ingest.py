@@ -0,0 +1,87 @@
+import os
+import hashlib
+
+from flask import Request, current_app
+
+from app.gallery.media import is_video
+from app.gallery.models import Attachment
+from app.gallery.storage import open_writer, default_bucket
+
+
+class UploadStream:
+    def __init__(self, bucket, key, part_size, image_limit=0):
+        self.bucket = bucket
+        self.key = key
+        self.image_limit = image_limit
+        self.image_data = bytearray() if image_limit else None
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.writer = open_writer(bucket, key, part_size)
+        self.completed = False
+        self.closed = False
+
+    @classmethod
+    def for_request(cls, artwork_id, filename):
+        config = current_app.config
+        extension = os.path.splitext(filename)[1]
+        key = Attachment.create_file_name(artwork_id, extension)
+        image_limit = 0 if is_video(filename) else config.get('UPLOAD_IMAGE_BUFFER',
+                                                             32 * 1024 * 1024)
+        return cls(default_bucket(), key,
+                   part_size=config.get('UPLOAD_PART_SIZE', 8 * 1024 * 1024),
+                   image_limit=image_limit)
+
+    @property
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        if self.image_data is not None:
+            if len(self.image_data) + len(data) > self.image_limit:
+                self.image_data = None
+            else:
+                self.image_data += data
+        self.writer.write(data)
+        return len(data)
+
+    def complete(self):
+        if not self.completed:
+            self.writer.complete()
+            self.completed = True
+
+    def seek(self, offset, whence=0):
+        return self.size
+
+    def tell(self):
+        return self.size
+
+    def readable(self):
+        return False
+
+    def writable(self):
+        return not self.completed
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        if self.closed:
+            return
+        if not self.completed:
+            self.writer.abort()
+        self.image_data = None
+        self.closed = True
+
+
+class UploadRequest(Request):
+    streaming_endpoints = ['gallery.file_upload']
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        if filename and self.endpoint in self.streaming_endpoints:
+            return UploadStream.for_request(self.view_args.get('artwork_id'), filename)
+        return super()._get_file_stream(total_content_length, content_type,
+                                        filename=filename,
+                                        content_length=content_length)
@@ -0,0 +1,124 @@
+import io
+import os
+import re
+import subprocess
+
+from PIL import Image, ImageOps
+import imageio_ffmpeg
+
+VIDEO_EXTENSIONS = ['.avi', '.mov', '.mp4', '.webm']
+MP4_VIDEO_CODECS = ['h264']
+MP4_AUDIO_CODECS = ['aac', 'mp3']
+THUMBNAIL_SIZE = (300, 500)
+VARIANT_WIDTHS = [480, 960, 1600]
+VARIANT_FORMATS = ['webp']
+MIME_TYPES = {'webp': 'image/webp', 'avif': 'image/avif'}
+
+
+def is_video(filename):
+    return os.path.splitext(filename)[1].lower() in VIDEO_EXTENSIONS
+
+
+def supported_formats(formats):
+    Image.init()
+    return [f for f in formats if f.upper() in Image.SAVE]
+
+
+def variant_name(width, image_format):
+    return 'w{}.{}'.format(width, image_format)
+
+
+def parse_variant(name):
+    size, _, image_format = name.partition('.')
+    return int(size[1:]), image_format
+
+
+def _encode(img, image_format, quality):
+    target = io.BytesIO()
+    img.save(target, format=image_format.upper(), quality=quality)
+    target.seek(0)
+    return target
+
+
+def make_variants(source, widths=VARIANT_WIDTHS, formats=VARIANT_FORMATS,
+                  thumbnail_size=THUMBNAIL_SIZE, quality=80):
+    variants = {}
+    with Image.open(source) as original:
+        image_format = original.format
+        largest = min(max(widths), original.width)
+        original.draft('RGB', (largest, largest * original.height // original.width))
+        img = ImageOps.exif_transpose(original)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    thumb_source = img
+    for width in sorted(widths, reverse=True):
+        if width > img.width:
+            continue
+        img = img.resize((width, max(round(img.height * width / img.width), 1)),
+                         Image.LANCZOS)
+        for variant_format in formats:
+            variants[variant_name(width, variant_format)] = _encode(img, variant_format, quality)
+        if img.width >= thumbnail_size[0]:
+            thumb_source = img
+    thumb = thumb_source.copy()
+    thumb.thumbnail(size=thumbnail_size)
+    if image_format == 'JPEG' and thumb.mode != 'RGB':
+        thumb = thumb.convert('RGB')
+    variants['thumb'] = _encode(thumb, image_format or 'JPEG', quality)
+    return variants
+
+
+def run_ffmpeg(*args):
+    command = [imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-nostdin', *args]
+    return subprocess.run(command, capture_output=True, text=True)
+
+
+def probe_video(path):
+    output = run_ffmpeg('-i', path).stderr
+    video = re.search(r'Stream #\S+.*?: Video: (\w+)', output)
+    audio = re.search(r'Stream #\S+.*?: Audio: (\w+)', output)
+    duration = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', output)
+    seconds = None
+    if duration:
+        hours, minutes, secs = duration.groups()
+        seconds = int(hours) * 3600 + int(minutes) * 60 + float(secs)
+    return {'video': video.group(1) if video else None,
+            'audio': audio.group(1) if audio else None,
+            'duration': seconds}
+
+
+def can_remux(info):
+    return (info['video'] in MP4_VIDEO_CODECS and
+            info['audio'] in MP4_AUDIO_CODECS + [None])
+
+
+def convert_to_mp4(path, path_mp4, info):
+    if can_remux(info):
+        codecs = ['-c', 'copy']
+    else:
+        codecs = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+                  '-pix_fmt', 'yuv420p', '-c:a', 'aac']
+    result = run_ffmpeg('-y', '-i', path, '-map', '0:v:0', '-map', '0:a:0?',
+                        *codecs, '-movflags', '+faststart', path_mp4)
+    if result.returncode != 0:
+        raise RuntimeError('ffmpeg failed for {}: {}'.format(path, result.stderr[-1000:]))
+    return path_mp4
+
+
+def extract_poster(path, poster_path, duration=None):
+    offset = min(1.0, duration / 2) if duration else 0
+    result = run_ffmpeg('-y', '-ss', str(offset), '-i', path,
+                        '-frames:v', '1', '-q:v', '2', poster_path)
+    if result.returncode != 0 or not os.path.isfile(poster_path):
+        raise RuntimeError('Unable to extract poster from {}'.format(path))
+    return poster_path
+
+
+def process_video(path, directory):
+    info = probe_video(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    path_mp4 = path
+    if os.path.splitext(path)[1].lower() != '.mp4' or not can_remux(info):
+        path_mp4 = convert_to_mp4(path, os.path.join(directory, name + '.mp4'), info)
+    poster = extract_poster(path_mp4, os.path.join(directory, name + '.jpg'), info['duration'])
+    return path_mp4, poster
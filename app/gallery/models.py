@@ -1,12 +1,17 @@
-import os
+import json
+import uuid
+import base64
+import binascii
 
-import boto3
 from flask import abort, flash, current_app
-from sqlalchemy import inspect
-from sqlalchemy.orm import ONETOMANY, MANYTOMANY
-from datetime import datetime
+from sqlalchemy import inspect, or_, and_
+from sqlalchemy.orm import ONETOMANY, MANYTOMANY, joinedload
+from datetime import datetime, date, timedelta
 
-from app import db, cache
+from app import db
+from app.gallery import media
+from app.gallery.storage import (get_s3_client, get_presigned_urls, variant_key,
+                                 download_fileobj, upload_many, delete_objects)
 
 
 artworks_tags = db.Table('artworks_tags',
@@ -18,19 +23,46 @@ artworks_tags = db.Table('artworks_tags',
                                    db.Integer,
                                    db.ForeignKey('tag.id'),
                                    primary_key=True))
+db.Index('ix_artworks_tags_tag_id_artwork_id',
+         artworks_tags.c.tag_id, artworks_tags.c.artwork_id)
+
+
+class KeysetPage:
+    def __init__(self, items, sort, sort_mode, cursor=None, next_cursor=None):
+        self.items = items
+        self.sort = sort
+        self.sort_mode = sort_mode
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
 
 
 class Entity:
     table_link = ''
     sort = 'id'
     sort_mode = 'asc'
+    sort_fields = ['id', 'name', 'timestamp_create', 'timestamp_update']
     search = []
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), default='')
     no_active = db.Column(db.Boolean, default=False)
-    timestamp_create = db.Column(db.DateTime(), default=datetime.utcnow())
-    timestamp_update = db.Column(db.DateTime(), default=datetime.utcnow(),
-                                 onupdate=datetime.utcnow())
+    timestamp_create = db.Column(db.DateTime(), default=datetime.utcnow)
+    timestamp_update = db.Column(db.DateTime(), default=datetime.utcnow,
+                                 onupdate=datetime.utcnow, index=True)
+    hot_filters = []
 
     @staticmethod
     def get_class(class_name):
@@ -47,46 +79,167 @@ class Entity:
         return list(c.__name__ for c in cls.__subclasses__())
 
     @classmethod
-    def get_items(cls, tuple_mode=False, data_filter=None, data_search=None):
-        param = {'no_active': False}
-        if data_filter:
-            param = {**param, **data_filter}
-        items = cls.query.filter_by(**param)
-        if data_search:
-            items = items.filter(*data_search)
-        if cls.sort_mode == 'asc':
-            items = items.order_by(getattr(cls, cls.sort).asc())
-        else:
-            items = items.order_by(getattr(cls, cls.sort).desc())
+    def get_load_options(cls):
+        return []
+
+    @classmethod
+    def get_items(cls, tuple_mode=False, data_filter=None, data_search=None, options=None):
         if tuple_mode:
-            items = [(i.id, i.name) for i in items]
+            items = cls.get_choices(data_filter=data_filter, data_search=data_search)
             items.insert(0, (0, '-Select-'))
-        else:
-            items = [i for i in items]
+            return items
+        items = cls.active_query(data_filter=data_filter, data_search=data_search)
+        items = cls.order_query(items.options(*cls.get_load_options(), *(options or [])))
+        items = [i for i in items]
         return items
 
     @classmethod
-    def get_pagination(cls, page, data_filter=None, data_search=None):
+    def active_query(cls, query=None, data_filter=None, data_search=None):
         param = {'no_active': False}
         if data_filter:
             param = {**param, **data_filter}
-        items = cls.query.filter_by(**param)
+        query = (query if query is not None else cls.query).filter_by(**param)
         if data_search:
-            items = items.filter(*data_search)
-        if cls.sort_mode == 'asc':
-            items = items.order_by(getattr(cls, cls.sort).asc())
-        else:
-            items = items.order_by(getattr(cls, cls.sort).desc())
-        items = items.paginate(page, current_app.config['ROWS_PER_PAGE'], False)
+            query = query.filter(*data_search)
+        return query
+
+    @classmethod
+    def order_query(cls, query, sort=None, sort_mode=None):
+        column = getattr(cls, sort or cls.sort)
+        if (sort_mode or cls.sort_mode) == 'asc':
+            return query.order_by(column.asc())
+        return query.order_by(column.desc())
+
+    @classmethod
+    def get_choices(cls, prefix=None, ids=None, limit=None, data_filter=None, data_search=None):
+        items = cls.active_query(db.session.query(cls.id, cls.name),
+                                 data_filter=data_filter, data_search=data_search)
+        if prefix:
+            items = items.filter(cls.name.istartswith(prefix, autoescape=True))
+        if ids is not None:
+            items = items.filter(cls.id.in_(ids))
+        items = cls.order_query(items)
+        if limit:
+            items = items.limit(limit)
+        return [(i.id, i.name) for i in items]
+
+    @classmethod
+    def get_sort(cls, sort=None, sort_mode=None):
+        if sort not in cls.sort_fields:
+            sort = cls.sort
+        if sort_mode not in ('asc', 'desc'):
+            sort_mode = cls.sort_mode
+        return sort, sort_mode
+
+    @classmethod
+    def get_pagination(cls, page=1, data_filter=None, data_search=None,
+                       keyset=False, cursor=None, sort=None, sort_mode=None, options=None):
+        items = cls.active_query(cls.query.options(*cls.get_load_options(), *(options or [])),
+                                 data_filter=data_filter, data_search=data_search)
+        sort, sort_mode = cls.get_sort(sort, sort_mode)
+        if keyset:
+            return cls.get_keyset_page(items, cursor, sort, sort_mode)
+        items = cls.order_query(items, sort, sort_mode)
+        items = items.paginate(page=page,
+                               per_page=current_app.config['ROWS_PER_PAGE'],
+                               error_out=False)
         return items
 
     @classmethod
-    def get_object(cls, id, mode_404=True):
+    def get_validator(cls, data_filter=None, data_search=None):
+        return tuple(cls.validator_query(data_filter, data_search).one())
+
+    @classmethod
+    def validator_query(cls, data_filter=None, data_search=None):
+        query = (db.session.query(db.func.count(cls.id), db.func.max(cls.timestamp_update))
+                 .select_from(cls))
+        return cls.active_query(query, data_filter=data_filter, data_search=data_search)
+
+    @classmethod
+    def get_last_update(cls):
+        return db.session.query(db.func.max(cls.timestamp_update)).scalar()
+
+    @classmethod
+    def get_keyset_page(cls, items, cursor, sort, sort_mode):
+        per_page = current_app.config['ROWS_PER_PAGE']
+        rows = cls.keyset_query(items, cursor, sort, sort_mode, per_page + 1).all()
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = cls.encode_cursor(getattr(rows[-1], sort), rows[-1].id)
+        return KeysetPage(rows, sort, sort_mode,
+                          cursor=cursor, next_cursor=next_cursor)
+
+    @classmethod
+    def keyset_query(cls, items, cursor, sort, sort_mode, limit):
+        column = getattr(cls, sort)
+        if cursor:
+            last_value, last_id = cls.decode_cursor(cursor, sort)
+            items = items.filter(cls.keyset_condition(column, sort_mode,
+                                                      last_value, last_id))
+        if sort == 'id':
+            order = [column.asc() if sort_mode == 'asc' else column.desc()]
+        elif sort_mode == 'asc':
+            order = [column.asc().nullslast(), cls.id.asc()]
+        else:
+            order = [column.desc().nullslast(), cls.id.desc()]
+        return items.order_by(*order).limit(limit)
+
+    @classmethod
+    def query_shapes(cls):
+        page = cls.active_query(cls.query.options(*cls.get_load_options()))
+        shapes = {'items': cls.order_query(cls.active_query()),
+                  'page': cls.keyset_query(page, None, cls.sort, cls.sort_mode, 21),
+                  'page_next': cls.keyset_query(page, cls.encode_cursor(1, 1), cls.sort,
+                                                cls.sort_mode, 21),
+                  'object': cls.query.filter_by(no_active=False, id=1),
+                  'validator': cls.validator_query(),
+                  'last_update': db.session.query(db.func.max(cls.timestamp_update))}
+        for data_filter in cls.hot_filters:
+            name = 'items[{}]'.format(','.join(data_filter))
+            shapes[name] = cls.order_query(cls.active_query(data_filter=data_filter))
+        return shapes
+
+    @classmethod
+    def keyset_condition(cls, column, sort_mode, last_value, last_id):
+        after_id = cls.id > last_id if sort_mode == 'asc' else cls.id < last_id
+        if column is cls.id:
+            return after_id
+        if last_value is None:
+            return and_(column.is_(None), after_id)
+        after_value = column > last_value if sort_mode == 'asc' else column < last_value
+        return or_(after_value,
+                   and_(column == last_value, after_id),
+                   column.is_(None))
+
+    @staticmethod
+    def encode_cursor(value, id):
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        data = json.dumps([value, id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode_cursor(cls, cursor, sort):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            value, id = json.loads(data)
+            id = int(id)
+            python_type = getattr(cls, sort).type.python_type
+            if value is not None and python_type in (datetime, date):
+                value = python_type.fromisoformat(value)
+        except (binascii.Error, ValueError, TypeError):
+            abort(400)
+        return value, id
+
+    @classmethod
+    def get_object(cls, id, mode_404=True, options=None):
         param = {'no_active': False, 'id': id}
+        query = cls.query.options(*(options or []))
         if mode_404:
-            obj = cls.query.filter_by(**param).first_or_404()
+            obj = query.filter_by(**param).first_or_404()
         else:
-            obj = cls.query.filter_by(**param).first()
+            obj = query.filter_by(**param).first()
         return obj
 
     @classmethod
@@ -126,34 +279,55 @@ class Entity:
 
 
 class ArtworkType(Entity, db.Model):
+    __table_args__ = (db.Index('ix_artwork_type_no_active_id', 'no_active', 'id'),)
     artworks = db.relationship('Artwork', backref='type')
     features = db.relationship('Feature', backref='type')
 
 
 class Feature(Entity, db.Model):
+    __table_args__ = (db.Index('ix_feature_no_active_id', 'no_active', 'id'),
+                      db.Index('ix_feature_type_id_no_active_id', 'type_id', 'no_active', 'id'))
+    hot_filters = [{'type_id': 1}]
     type_id = db.Column(db.Integer, db.ForeignKey('artwork_type.id'),
                         nullable=False)
     values = db.relationship('FeaturesValue', backref='feature', cascade='all, delete')
 
 
 class FeaturesValue(Entity, db.Model):
-    artwork_id = db.Column(db.Integer, db.ForeignKey('artwork.id'),
-                           primary_key=True)
-    feature_id = db.Column(db.Integer, db.ForeignKey('feature.id'),
-                           primary_key=True)
+    __table_args__ = (db.Index('ix_features_value_feature_id_value_no_active_artwork_id',
+                               'feature_id', 'value', 'no_active', 'artwork_id'),
+                      db.Index('ix_features_value_artwork_id_feature_id_value_no_active',
+                               'artwork_id', 'feature_id', 'value', 'no_active'),
+                      db.Index('ix_features_value_no_active_id', 'no_active', 'id'),
+                      db.UniqueConstraint('artwork_id', 'feature_id'))
+    hot_filters = [{'artwork_id': 1}]
+    artwork_id = db.Column(db.Integer, db.ForeignKey('artwork.id'), nullable=False)
+    feature_id = db.Column(db.Integer, db.ForeignKey('feature.id'), nullable=False)
     value = db.Column(db.String(32))
 
 
 class Artwork(Entity, db.Model):
+    __table_args__ = (db.Index('ix_artwork_no_active_id', 'no_active', 'id'),
+                      db.Index('ix_artwork_no_active_name_id', 'no_active', 'name', 'id'),
+                      db.Index('ix_artwork_type_id_no_active_id', 'type_id', 'no_active', 'id'))
+    hot_filters = [{'type_id': 1}]
+    sort_fields = Entity.sort_fields + ['author', 'year', 'buy_price']
+    search = ['name', 'author', 'info']
     type_id = db.Column(db.Integer, db.ForeignKey('artwork_type.id'), nullable=False)
     author = db.Column(db.String(32))
     year = db.Column(db.String(10))
     buy_price = db.Column(db.Integer)
     info = db.Column(db.Text)
-    files = db.relationship('Attachment', backref='artwork', cascade='all, delete')
+    main_attachment_id = db.Column(db.Integer,
+                                   db.ForeignKey('attachment.id', use_alter=True,
+                                                 ondelete='SET NULL'))
+    files = db.relationship('Attachment', backref='artwork', cascade='all, delete',
+                            foreign_keys='Attachment.artwork_id')
+    main_attachment = db.relationship('Attachment', foreign_keys=[main_attachment_id],
+                                      post_update=True)
     features_values = db.relationship('FeaturesValue', backref='artwork', cascade='all, delete')
     offers = db.relationship('Offer', backref='artwork')
-    tags = db.relationship('Tag', secondary=artworks_tags, lazy='subquery',
+    tags = db.relationship('Tag', secondary=artworks_tags,
                            backref=db.backref('artwork', lazy=True))
 
     def get_feature_value(self, feature_id):
@@ -172,29 +346,99 @@ class Artwork(Entity, db.Model):
         if feature_value:
             feature_value.value = value
 
+    @classmethod
+    def get_load_options(cls):
+        return [joinedload(cls.main_attachment)]
+
+    @classmethod
+    def get_view_validator(cls, id):
+        def aggregate(func, *criteria):
+            return db.select(func).where(*criteria).scalar_subquery()
+
+        row = db.session.execute(
+            db.select(cls.timestamp_update,
+                      aggregate(db.func.count(Attachment.id), Attachment.artwork_id == cls.id),
+                      aggregate(db.func.max(Attachment.timestamp_update),
+                                Attachment.artwork_id == cls.id),
+                      aggregate(db.func.count(FeaturesValue.id),
+                                FeaturesValue.artwork_id == cls.id),
+                      aggregate(db.func.max(FeaturesValue.timestamp_update),
+                                FeaturesValue.artwork_id == cls.id),
+                      aggregate(db.func.max(Feature.timestamp_update),
+                                Feature.type_id == cls.type_id),
+                      db.select(db.func.max(Tag.timestamp_update)).scalar_subquery())
+            .where(cls.id == id, cls.no_active.is_(False))).first()
+        return tuple(row) if row else None
+
     @property
     def main_image(self):
-        if not len(self.files):
-            return None
-        for file in self.files:
-            if file.main_image:
-                return file
-        return self.files[0]
+        return self.main_attachment
 
     def add_tag(self, tag):
         if tag not in self.tags:
             self.tags.append(tag)
+            self.timestamp_update = datetime.utcnow()
+            tag.change_count(1)
 
     def delete_tag(self, tag):
         if tag in self.tags:
             self.tags.remove(tag)
+            self.timestamp_update = datetime.utcnow()
+            tag.change_count(-1)
+
+    @staticmethod
+    def tag_filter(tag_ids, match_all=False):
+        tag_ids = list(set(tag_ids))
+        select = (db.select(artworks_tags.c.artwork_id)
+                  .where(artworks_tags.c.tag_id.in_(tag_ids)))
+        if match_all and len(tag_ids) > 1:
+            select = (select.group_by(artworks_tags.c.artwork_id)
+                      .having(db.func.count(artworks_tags.c.tag_id) == len(tag_ids)))
+        return Artwork.id.in_(select)
 
 
 class Tag(Entity, db.Model):
-    pass
+    __table_args__ = (db.Index('ix_tag_no_active_id', 'no_active', 'id'),
+                      db.Index('ix_tag_no_active_name_id', 'no_active', 'name', 'id'))
+    sort_fields = Entity.sort_fields + ['artwork_count']
+    artwork_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    def change_count(self, delta):
+        (Tag.query
+         .filter_by(id=self.id)
+         .update({'artwork_count': Tag.artwork_count + delta},
+                 synchronize_session=False))
+
+    @staticmethod
+    def count_update(tag_ids=None):
+        count = (db.select(db.func.count(artworks_tags.c.artwork_id))
+                 .select_from(artworks_tags.join(Artwork, Artwork.id == artworks_tags.c.artwork_id))
+                 .where(artworks_tags.c.tag_id == Tag.id, Artwork.no_active.is_(False))
+                 .scalar_subquery())
+        statement = db.update(Tag).values(artwork_count=count)
+        if tag_ids is not None:
+            statement = statement.where(Tag.id.in_(tag_ids))
+        return statement.execution_options(synchronize_session=False)
+
+    @staticmethod
+    def recount(tag_ids=None):
+        result = db.session.execute(Tag.count_update(tag_ids))
+        db.session.commit()
+        return result.rowcount
+
+
+@db.event.listens_for(Artwork, 'after_delete')
+def _release_artwork_tags(mapper, connection, target):
+    tag_ids = [tag.id for tag in target.tags]
+    if tag_ids:
+        connection.execute(Tag.count_update(tag_ids))
 
 
 class Client(Entity, db.Model):
+    __table_args__ = (db.Index('ix_client_no_active_id', 'no_active', 'id'),
+                      db.Index('ix_client_no_active_name_id', 'no_active', 'name', 'id'))
+    sort_fields = Entity.sort_fields + ['phone', 'birthday']
+    search = ['name', 'phone', 'info']
     name = db.Column(db.String(64), index=True, nullable=False)
     phone = db.Column(db.String(16), index=True, nullable=False)
     birthday = db.Column(db.Date)
@@ -203,25 +447,110 @@ class Client(Entity, db.Model):
 
 
 class Attachment(Entity, db.Model):
+    __table_args__ = (db.Index('ix_attachment_no_active_id', 'no_active', 'id'),
+                      db.Index('ix_attachment_artwork_id_no_active_id',
+                               'artwork_id', 'no_active', 'id'),
+                      db.Index('ix_attachment_no_active_path_name',
+                               'no_active', 'path', 'name'))
+    hot_filters = [{'artwork_id': 1}]
     artwork_id = db.Column(db.Integer, db.ForeignKey('artwork.id'),
                            nullable=False)
     path = db.Column(db.String(128))
-    hash = db.Column(db.String(64))
+    hash = db.Column(db.String(64), index=True)
     main_image = db.Column(db.Boolean, default=False)
     info = db.Column(db.Text)
+    state = db.Column(db.String(16), default='ready', server_default='ready')
+    attempts = db.Column(db.Integer, default=0, server_default='0')
+    variants = db.Column(db.String(256))
+
+    @property
+    def is_ready(self):
+        return self.state == 'ready'
+
+    @staticmethod
+    def claim(id, max_attempts):
+        claimed = (Attachment.query
+                   .filter(Attachment.id == id,
+                           Attachment.state.in_(['pending', 'failed']),
+                           Attachment.attempts < max_attempts)
+                   .update({'state': 'processing',
+                            'attempts': Attachment.attempts + 1},
+                           synchronize_session=False))
+        db.session.commit()
+        return claimed == 1
+
+    @staticmethod
+    def release_stale(timeout, max_attempts):
+        cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+        released = (Attachment.query
+                    .filter(Attachment.state == 'processing',
+                            Attachment.timestamp_update < cutoff)
+                    .update({'state': db.case((Attachment.attempts < max_attempts, 'pending'),
+                                              else_='failed')},
+                            synchronize_session=False))
+        db.session.commit()
+        return released
+
+    @staticmethod
+    def find_by_hash(hash):
+        return (Attachment.query
+                .filter(Attachment.hash == hash,
+                        Attachment.state == 'ready',
+                        Attachment.no_active.is_(False))
+                .order_by(Attachment.id)
+                .first())
+
+    @staticmethod
+    def find_by_key(bucket, key):
+        stem = key.partition('_')[2].rsplit('.', 1)[0]
+        active = [Attachment.no_active.is_(False), Attachment.path == bucket]
+        items = Attachment.query.filter(or_(and_(*active, Attachment.name == key),
+                                            and_(*active, Attachment.name >= stem + '.',
+                                                 Attachment.name < stem + '/')))
+        return next((a for a in items if key in a.object_keys), None)
+
+    def copy_content(self, original):
+        self.name = original.name
+        self.path = original.path
+        self.variants = original.variants
+        self.state = original.state
+
+    @property
+    def object_keys(self):
+        variants = self.variants.split(',') if self.variants else []
+        if not self.is_video and 'thumb' not in variants:
+            variants.append('thumb')
+        return [self.name] + [variant_key(self.name, v) for v in variants]
+
+    @property
+    def thumb_variant(self):
+        return 'thumb.jpg' if self.is_video else 'thumb'
+
+    @property
+    def has_thumbnail(self):
+        if not self.is_video:
+            return True
+        return bool(self.variants) and self.thumb_variant in self.variants.split(',')
+
+    def is_shared(self):
+        return db.session.query(
+            Attachment.query
+            .filter(Attachment.path == self.path,
+                    Attachment.name == self.name,
+                    Attachment.id != self.id)
+            .exists()).scalar()
 
     @property
     def is_video(self):
-        extension = os.path.splitext(self.name)[1]
-        return extension in ['.avi', '.mov', '.mp4', '.webm']
+        return media.is_video(self.name)
 
     @staticmethod
-    def create_file_name(artwork, extension):
-        if not artwork:
+    def create_file_name(artwork_id, extension):
+        if not artwork_id:
             return ''
         return ('attachment_' +
-                str(artwork.id) + '_' +
-                str(len(artwork.files) + 1) +
+                str(artwork_id) + '_' +
+                uuid.uuid4().hex[:12] +
                 extension)
 
     @staticmethod
@@ -231,52 +560,111 @@ class Attachment(Entity, db.Model):
 
     @staticmethod
     def get_aws_client():
-        return boto3.client(service_name='s3',
-                            aws_access_key_id=current_app.config['AWS_KEY_ID'],
-                            aws_secret_access_key=current_app.config['AWS_SECRET_KEY'],
-                            region_name=current_app.config['AWS_REGION'])
+        return get_s3_client()
+
+    @staticmethod
+    def get_public_urls(attachments, thumbnail=False):
+        objects = [(a.path, a.name, a.thumb_variant if thumbnail else None)
+                   for a in attachments]
+        urls = get_presigned_urls(objects)
+        return {a.id: urls[obj] for a, obj in zip(attachments, objects)}
 
-    @cache.memoize()
     def get_aws_public_url(self, thumbnail=False):
-        filename = self.name
-        if thumbnail:
-            filename = 'thumb_' + filename
-        s3_client = Attachment.get_aws_client()
-        return s3_client.generate_presigned_url(
-            'get_object', Params={'Bucket': self.path, 'Key': filename})
+        return Attachment.get_public_urls([self], thumbnail=thumbnail)[self.id]
+
+    def aws_upload_variants(self, variants):
+        objects = {variant_key(self.name, variant): source
+                   for variant, source in variants.items()}
+        return upload_many(self.path, objects)
 
     def aws_upload_file(self, path, thumbnail=False):
-        filename = self.name
-        if thumbnail:
-            filename = 'thumb_' + filename
-        s3_client = Attachment.get_aws_client()
-        s3_client.upload_file(Filename=path,
-                              Bucket=current_app.config['AWS_BUCKET_NAME'],
-                              Key=filename)
+        return self.aws_upload_variants({self.thumb_variant if thumbnail else None: path})
+
+    def aws_upload_fileobj(self, fileobj, thumbnail=False):
+        return self.aws_upload_variants({self.thumb_variant if thumbnail else None: fileobj})
+
+    def aws_download_fileobj(self, fileobj):
+        download_fileobj(self.path, self.name, fileobj)
+
+    def create_variants(self, source):
+        config = current_app.config
+        formats = media.supported_formats(config.get('IMAGE_VARIANT_FORMATS',
+                                                     media.VARIANT_FORMATS))
+        variants = media.make_variants(source,
+                                       widths=config.get('IMAGE_VARIANT_WIDTHS',
+                                                         media.VARIANT_WIDTHS),
+                                       formats=formats,
+                                       quality=config.get('IMAGE_VARIANT_QUALITY', 80))
+        variants[self.thumb_variant] = variants.pop('thumb')
+        timings = self.aws_upload_variants(variants)
+        self.variants = ','.join(variants)
+        return timings
+
+    @property
+    def variant_names(self):
+        if not self.variants:
+            return []
+        return [v for v in self.variants.split(',') if not v.startswith('thumb')]
+
+    @staticmethod
+    def get_picture_sources(attachments):
+        objects = [(a.path, a.name, v) for a in attachments for v in a.variant_names]
+        urls = get_presigned_urls(objects)
+        sources = {}
+        for a in attachments:
+            by_format = {}
+            for v in a.variant_names:
+                width, image_format = media.parse_variant(v)
+                by_format.setdefault(image_format, []).append(
+                    '{} {}w'.format(urls[(a.path, a.name, v)], width))
+            sources[a.id] = [(media.MIME_TYPES.get(f, 'image/' + f), ', '.join(srcset))
+                             for f, srcset in by_format.items()]
+        return sources
 
     def delete_file(self):
-        s3_client = Attachment.get_aws_client()
-        s3_client.delete_object(Bucket=current_app.config['AWS_BUCKET_NAME'],
-                                Key=self.name)
+        if not self.is_shared():
+            delete_objects(self.path, self.object_keys)
+        artwork = self.artwork
+        if artwork.main_attachment_id == self.id:
+            successor = (Attachment.query
+                         .filter(Attachment.artwork_id == artwork.id,
+                                 Attachment.id != self.id,
+                                 Attachment.no_active.is_(False))
+                         .order_by(Attachment.id)
+                         .first())
+            artwork.main_attachment = successor
+            if successor:
+                successor.main_image = True
         db.session.delete(self)
         db.session.commit()
 
     def set_main_image(self):
-        for file in self.artwork.files:
-            if not file.id == self.id:
-                file.main_image = False
+        (Attachment.query
+         .filter(Attachment.artwork_id == self.artwork_id,
+                 Attachment.id != self.id,
+                 Attachment.main_image.is_(True))
+         .update({'main_image': False}, synchronize_session=False))
         self.main_image = True
+        self.artwork.main_attachment = self
 
 
 class Status(Entity, db.Model):
+    __table_args__ = (db.Index('ix_status_no_active_id', 'no_active', 'id'),)
     offers = db.relationship('Offer', backref='status')
 
 
 class Offer(Entity, db.Model):
+    __table_args__ = (db.Index('ix_offer_no_active_id', 'no_active', 'id'),)
+    sort_fields = Entity.sort_fields + ['price']
+    hot_filters = [{'artwork_id': 1}, {'client_id': 1}, {'status_id': 1}]
     artwork_id = db.Column(db.Integer, db.ForeignKey('artwork.id'),
-                           nullable=False)
+                           nullable=False, index=True)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'),
-                          nullable=False)
+                          nullable=False, index=True)
     price = db.Column(db.Integer)
-    status_id = db.Column(db.Integer, db.ForeignKey('status.id'))
+    status_id = db.Column(db.Integer, db.ForeignKey('status.id'), index=True)
     info = db.Column(db.Text)
+
+    @classmethod
+    def get_load_options(cls):
+        return [joinedload(cls.client), joinedload(cls.artwork), joinedload(cls.status)]
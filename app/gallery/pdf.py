@@ -0,0 +1,194 @@
+import io
+import os
+import time
+import zipfile
+import tempfile
+import multiprocessing
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from flask import current_app
+from fpdf import FPDF
+
+from app import cache
+from app.gallery import storage
+from app.gallery.models import Artwork, Tag, Offer
+
+
+def get_image_bytes(attachment):
+    return read_cached_image(attachment.path,
+                             storage.variant_key(attachment.name, attachment.thumb_variant))
+
+
+def read_cached_image(bucket, key):
+    cache_key = 'image:{}:{}'.format(bucket, key)
+    data = cache.get(cache_key)
+    if data is None:
+        buffer = io.BytesIO()
+        storage.download_fileobj(bucket, key, buffer)
+        data = buffer.getvalue()
+        cache.set(cache_key, data, timeout=current_app.config.get('PDF_CACHE_TIMEOUT', 86400))
+    return data
+
+
+def render_sheet(artwork, template, image_path=None):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    if template == '0' and image_path:
+        pdf.image(image_path, x=10, y=8, w=100)
+        pdf.ln(80)
+    pdf.cell(200, 10, txt="{}".format(artwork.author), ln=1)
+    pdf.ln(3)
+    pdf.cell(200, 10, txt="{}".format(artwork.year), ln=1)
+    pdf.ln(3)
+    pdf.cell(200, 10, txt="{}".format(artwork.info), ln=1)
+    if template == '1' and image_path:
+        pdf.image(image_path, x=10, y=58, w=100)
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def render_sheet_with_image(artwork, template):
+    image = artwork.main_image
+    if not image or not image.is_ready or not image.has_thumbnail:
+        return render_sheet(artwork, template)
+    extension = os.path.splitext(storage.variant_key(image.name, image.thumb_variant))[1]
+    with tempfile.NamedTemporaryFile(suffix=extension,
+                                     dir=current_app.config.get('MEDIA_TEMP_FOLDER')) as file:
+        file.write(get_image_bytes(image))
+        file.flush()
+        return render_sheet(artwork, template, file.name)
+
+
+def get_sheet(artwork, template):
+    cache_key = 'pdf:{}:{}:{}:{}'.format(artwork.id, template,
+                                          artwork.timestamp_update.isoformat(),
+                                          artwork.main_attachment_id)
+    data = cache.get(cache_key)
+    if data is None:
+        data = render_sheet_with_image(artwork, template)
+        cache.set(cache_key, data, timeout=current_app.config.get('PDF_CACHE_TIMEOUT', 86400))
+    return data
+
+
+def latin1(value):
+    text = '{}'.format(value if value is not None else '')
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+
+def catalog_query(type_id=None, tag_ids=None, status_id=None):
+    query = (Artwork.query
+             .options(*Artwork.get_load_options())
+             .filter(Artwork.no_active.is_(False)))
+    if type_id:
+        query = query.filter(Artwork.type_id == type_id)
+    if tag_ids:
+        query = query.filter(Artwork.tags.any(Tag.id.in_(tag_ids)))
+    if status_id:
+        query = query.filter(Artwork.offers.any(Offer.status_id == status_id))
+    return query.order_by(Artwork.id)
+
+
+def catalog_entry(artwork):
+    image = artwork.main_image
+    if image and image.is_ready and image.has_thumbnail:
+        image = (image.path, image.name, image.thumb_variant)
+    else:
+        image = None
+    return {'id': artwork.id, 'name': artwork.name, 'author': artwork.author,
+            'year': artwork.year, 'info': artwork.info, 'image': image}
+
+
+def fetch_entry_image(app, entry):
+    if entry['image']:
+        bucket, name, variant = entry['image']
+        key = storage.variant_key(name, variant)
+        with app.app_context():
+            data = read_cached_image(bucket, key)
+        entry = {**entry, 'image': (os.path.splitext(key)[1], data)}
+    return entry
+
+
+def render_catalog_chunk(entries):
+    pdf = FPDF()
+    pdf.set_font("Arial", size=12)
+    if not entries:
+        pdf.add_page()
+        pdf.cell(200, 10, txt='No artworks', ln=1)
+    with tempfile.TemporaryDirectory() as directory:
+        for entry in entries:
+            pdf.add_page()
+            if entry['image']:
+                extension, data = entry['image']
+                path = os.path.join(directory, '{}{}'.format(entry['id'], extension))
+                with open(path, 'wb') as file:
+                    file.write(data)
+                pdf.image(path, x=10, y=8, w=100)
+                pdf.ln(80)
+            pdf.set_font("Arial", 'B', size=14)
+            pdf.cell(200, 10, txt=latin1(entry['name']), ln=1)
+            pdf.set_font("Arial", size=12)
+            pdf.cell(200, 10, txt=latin1(entry['author']), ln=1)
+            pdf.cell(200, 10, txt=latin1(entry['year']), ln=1)
+            pdf.multi_cell(190, 8, txt=latin1(entry['info']))
+        return pdf.output(dest='S').encode('latin-1')
+
+
+def iter_catalog_chunks(entries, chunk_size):
+    app = current_app._get_current_object()
+    config = app.config
+    workers = config.get('CATALOG_WORKERS') or os.cpu_count()
+    context = multiprocessing.get_context(config.get('MEDIA_WORKER_START_METHOD', 'spawn'))
+    with ThreadPoolExecutor(max_workers=config.get('CATALOG_FETCH_WORKERS', 8)) as fetcher, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context) as renderer:
+        pending = deque()
+        for start in range(0, len(entries), chunk_size):
+            chunk = entries[start:start + chunk_size]
+            prepared = list(fetcher.map(partial(fetch_entry_image, app), chunk))
+            pending.append(renderer.submit(render_catalog_chunk, prepared))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _StreamSink:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_catalog(query, output_format='pdf', chunk_size=50):
+    logger = current_app.logger
+    entries = [catalog_entry(a) for a in query]
+    if output_format == 'pdf':
+        chunk_size = max(len(entries), 1)
+    start = time.perf_counter()
+    if entries:
+        chunks = iter_catalog_chunks(entries, chunk_size)
+    else:
+        chunks = iter([render_catalog_chunk([])])
+    if output_format == 'pdf':
+        yield from chunks
+    else:
+        sink = _StreamSink()
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for number, data in enumerate(chunks, 1):
+                archive.writestr('catalog_{:03d}.pdf'.format(number), data)
+                yield sink.pop()
+        yield sink.pop()
+    elapsed = time.perf_counter() - start
+    logger.info('Exported catalog of %s artworks in %.2fs (%.1f artworks/s)',
+                len(entries), elapsed, len(entries) / elapsed if elapsed else 0)
@@ -0,0 +1,67 @@
+import re
+import json
+
+from app import db
+from app.gallery.models import Entity
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+
+
+def sqlite_scan(line):
+    match = SQLITE_SCAN.match(line)
+    if match and match.group(1) != 'CONSTANT' and 'USING' not in match.group(2):
+        return match.group(1)
+    return None
+
+
+def compile_statement(connection, statement):
+    if hasattr(statement, 'statement'):
+        statement = statement.statement
+    return str(statement.compile(dialect=connection.dialect,
+                                 compile_kwargs={'literal_binds': True}))
+
+
+def explain_sqlite(connection, sql):
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).all()
+    lines = [r[-1] for r in rows]
+    scans = [t for t in map(sqlite_scan, lines) if t]
+    return lines, scans
+
+
+def walk_plan(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk_plan(child)
+
+
+def explain_postgresql(connection, sql):
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    result = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + sql).scalar()
+    plan = (json.loads(result) if isinstance(result, str) else result)[0]['Plan']
+    nodes = list(walk_plan(plan))
+    lines = ['{}{}'.format(n['Node Type'],
+                           ' on ' + n['Relation Name'] if 'Relation Name' in n else '')
+             for n in nodes]
+    scans = [n['Relation Name'] for n in nodes if n['Node Type'] == 'Seq Scan']
+    return lines, scans
+
+
+EXPLAINERS = {'sqlite': explain_sqlite, 'postgresql': explain_postgresql}
+
+
+def entity_models():
+    return [m.class_ for m in db.Model.registry.mappers if issubclass(m.class_, Entity)]
+
+
+def explain_shapes(models=None):
+    connection = db.session.connection()
+    explainer = EXPLAINERS.get(connection.dialect.name)
+    if explainer is None:
+        raise ValueError('EXPLAIN is not supported for {}'.format(connection.dialect.name))
+    results = []
+    for model in sorted(models or entity_models(), key=lambda m: m.__tablename__):
+        for shape, statement in model.query_shapes().items():
+            lines, scans = explainer(connection, compile_statement(connection, statement))
+            results.append((model.__tablename__, shape, lines, scans))
+    db.session.rollback()
+    return results
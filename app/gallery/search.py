@@ -0,0 +1,221 @@
+import re
+
+from sqlalchemy import Select, event, text
+
+from app import db
+from app.gallery.models import Artwork, Client, Feature, FeaturesValue
+
+SEARCHABLE = {'artwork': Artwork, 'client': Client}
+ENTITY_CODES = {'artwork': 1, 'client': 2}
+ENTITY_SLOTS = 8
+
+SQLITE_DDL = ["CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+              "entity UNINDEXED, entity_id UNINDEXED, title, body, "
+              "tokenize='unicode61 remove_diacritics 2')"]
+POSTGRES_DDL = ["CREATE TABLE IF NOT EXISTS search_document ("
+                "entity VARCHAR(32) NOT NULL, entity_id INTEGER NOT NULL, "
+                "document TSVECTOR NOT NULL, PRIMARY KEY (entity, entity_id))",
+                "CREATE INDEX IF NOT EXISTS ix_search_document_document "
+                "ON search_document USING GIN (document)"]
+
+
+def get_dialect(connection):
+    return connection.dialect.name
+
+
+def is_supported(connection):
+    return get_dialect(connection) in ('sqlite', 'postgresql')
+
+
+def create_index(connection):
+    statements = SQLITE_DDL if get_dialect(connection) == 'sqlite' else POSTGRES_DDL
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def document_fields(obj):
+    title_field, *body_fields = type(obj).search
+    title = getattr(obj, title_field) or ''
+    body = ' '.join(str(getattr(obj, f)) for f in body_fields if getattr(obj, f))
+    return title, body
+
+
+def document_id(entity, entity_id):
+    return entity_id * ENTITY_SLOTS + ENTITY_CODES[entity]
+
+
+def remove_document(connection, entity, entity_id):
+    remove_selection(connection, entity, [entity_id])
+
+
+def index_document(connection, entity, obj):
+    index_many(connection, entity, [obj])
+
+
+def index_many(connection, entity, objs):
+    objs = list(objs)
+    if not objs:
+        return 0
+    remove_selection(connection, entity, [obj.id for obj in objs])
+    params = [dict(zip(('title', 'body'), document_fields(obj)),
+                   entity=entity, id=obj.id, rowid=document_id(entity, obj.id))
+              for obj in objs if not obj.no_active]
+    if not params:
+        return 0
+    if get_dialect(connection) == 'sqlite':
+        connection.execute(text('INSERT INTO search_fts (rowid, entity, entity_id, title, body) '
+                                'VALUES (:rowid, :entity, :id, :title, :body)'), params)
+    else:
+        connection.execute(text("INSERT INTO search_document (entity, entity_id, document) "
+                                "VALUES (:entity, :id, "
+                                "setweight(to_tsvector('simple', :title), 'A') || "
+                                "setweight(to_tsvector('simple', :body), 'B'))"), params)
+    return len(params)
+
+
+def remove_selection(connection, entity, ids):
+    if get_dialect(connection) == 'sqlite':
+        table = db.table('search_fts', db.column('rowid'))
+        if isinstance(ids, Select):
+            selected = ids.subquery()
+            rowids = db.select(document_id(entity, selected.c[0])).select_from(selected)
+        else:
+            rowids = [document_id(entity, i) for i in ids]
+        condition = table.c.rowid.in_(rowids)
+    else:
+        table = db.table('search_document', db.column('entity'), db.column('entity_id'))
+        condition = db.and_(table.c.entity == entity, table.c.entity_id.in_(ids))
+    return connection.execute(db.delete(table).where(condition)).rowcount
+
+
+def _listen(entity, cls):
+    def after_save(mapper, connection, target):
+        if is_supported(connection):
+            index_document(connection, entity, target)
+
+    def after_delete(mapper, connection, target):
+        if is_supported(connection):
+            remove_document(connection, entity, target.id)
+
+    event.listen(cls, 'after_insert', after_save)
+    event.listen(cls, 'after_update', after_save)
+    event.listen(cls, 'after_delete', after_delete)
+
+
+for _entity, _cls in SEARCHABLE.items():
+    _listen(_entity, _cls)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_index_after_create(target, connection, **kw):
+    if is_supported(connection):
+        create_index(connection)
+
+
+def rebuild_index(batch_size=1000):
+    connection = db.session.connection()
+    create_index(connection)
+    table = 'search_fts' if get_dialect(connection) == 'sqlite' else 'search_document'
+    connection.execute(text('DELETE FROM {}'.format(table)))
+    total = 0
+    for entity, cls in SEARCHABLE.items():
+        items = cls.query.filter_by(no_active=False).order_by(cls.id).yield_per(batch_size)
+        for obj in items:
+            index_document(connection, entity, obj)
+            total += 1
+    db.session.commit()
+    return total
+
+
+def fts5_query(terms):
+    tokens = re.findall(r'\w+', terms, flags=re.UNICODE)
+    return ' '.join('"{}"*'.format(token) for token in tokens)
+
+
+def search_ids(terms, limit=50):
+    connection = db.session.connection()
+    dialect = get_dialect(connection)
+    if dialect == 'sqlite':
+        match = fts5_query(terms)
+        if not match:
+            return []
+        rows = connection.execute(text(
+            'SELECT entity, entity_id, bm25(search_fts, 0, 0, 10.0, 1.0) AS rank '
+            'FROM search_fts WHERE search_fts MATCH :match '
+            'ORDER BY rank LIMIT :limit'), {'match': match, 'limit': limit})
+    elif dialect == 'postgresql':
+        rows = connection.execute(text(
+            "SELECT entity, entity_id, ts_rank(document, query) AS rank "
+            "FROM search_document, websearch_to_tsquery('simple', :terms) AS query "
+            "WHERE document @@ query ORDER BY rank DESC LIMIT :limit"),
+            {'terms': terms, 'limit': limit})
+    else:
+        return fallback_search_ids(terms, limit)
+    return [(row.entity, int(row.entity_id)) for row in rows]
+
+
+def fallback_search_ids(terms, limit):
+    results = []
+    for entity, cls in SEARCHABLE.items():
+        pattern = '%{}%'.format(terms)
+        items = (db.session.query(cls.id)
+                 .filter(cls.no_active.is_(False),
+                         db.or_(*[getattr(cls, f).ilike(pattern) for f in cls.search]))
+                 .limit(limit))
+        results.extend((entity, i.id) for i in items)
+    return results[:limit]
+
+
+def search(terms, limit=50):
+    ids = search_ids(terms, limit)
+    objects = {}
+    for entity, cls in SEARCHABLE.items():
+        entity_ids = [i for e, i in ids if e == entity]
+        if entity_ids:
+            items = cls.query.filter(cls.id.in_(entity_ids), cls.no_active.is_(False))
+            objects.update(((entity, obj.id), obj) for obj in items)
+    return [(entity, objects[(entity, i)]) for entity, i in ids if (entity, i) in objects]
+
+
+def parse_feature_filters(feature_ids, values):
+    pairs = []
+    for feature_id, value in zip(feature_ids, values):
+        if feature_id.isdigit() and int(feature_id) and value:
+            pairs.append((int(feature_id), value))
+    return list(dict.fromkeys(pairs))
+
+
+def feature_filter(pairs):
+    selects = [db.select(FeaturesValue.artwork_id)
+               .where(FeaturesValue.feature_id == feature_id,
+                      FeaturesValue.value == value,
+                      FeaturesValue.no_active.is_(False))
+               for feature_id, value in pairs]
+    if len(selects) == 1:
+        return selects[0]
+    return db.intersect(*selects)
+
+
+def feature_facets(pairs, limit=20):
+    matched = db.select(Artwork.id).where(Artwork.no_active.is_(False))
+    if pairs:
+        matched = matched.where(Artwork.id.in_(feature_filter(pairs)))
+    count = db.func.count(FeaturesValue.artwork_id)
+    position = db.func.row_number().over(partition_by=FeaturesValue.feature_id,
+                                         order_by=(count.desc(), FeaturesValue.value))
+    counts = (db.select(FeaturesValue.feature_id, FeaturesValue.value, count.label('total'),
+                        position.label('position'))
+              .where(FeaturesValue.artwork_id.in_(matched),
+                     FeaturesValue.no_active.is_(False),
+                     FeaturesValue.value.isnot(None),
+                     FeaturesValue.value != '')
+              .group_by(FeaturesValue.feature_id, FeaturesValue.value)
+              .subquery())
+    rows = db.session.execute(db.select(counts.c.feature_id, counts.c.value, counts.c.total)
+                              .where(counts.c.position <= limit)
+                              .order_by(counts.c.feature_id, counts.c.position))
+    facets = {}
+    for row in rows:
+        facets.setdefault(row.feature_id, []).append((row.value, row.total))
+    features = Feature.query.filter(Feature.id.in_(facets), Feature.no_active.is_(False))
+    return [(feature, facets[feature.id]) for feature in features.order_by(Feature.name)]
@@ -0,0 +1,341 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from flask import current_app, abort, redirect, send_file, url_for, make_response
+from werkzeug.security import safe_join
+
+from app import cache
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+_lock = threading.Lock()
+_s3_client = None
+_storage = None
+_transfer_executor = None
+
+
+def _reset_after_fork():
+    global _lock, _s3_client, _storage, _transfer_executor
+    _lock = threading.Lock()
+    _s3_client = None
+    _storage = None
+    _transfer_executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def create_s3_client(config):
+    session = boto3.session.Session(aws_access_key_id=config['AWS_KEY_ID'],
+                                    aws_secret_access_key=config['AWS_SECRET_KEY'],
+                                    region_name=config['AWS_REGION'])
+    client_config = Config(max_pool_connections=config.get('AWS_MAX_POOL_CONNECTIONS', 10))
+    return session.client(service_name='s3',
+                          endpoint_url=config.get('AWS_ENDPOINT_URL'),
+                          config=client_config)
+
+
+def get_s3_client():
+    global _s3_client
+    client = _s3_client
+    if client is None:
+        with _lock:
+            if _s3_client is None:
+                _s3_client = create_s3_client(current_app.config)
+            client = _s3_client
+    return client
+
+
+def get_transfer_executor():
+    global _transfer_executor
+    executor = _transfer_executor
+    if executor is None:
+        with _lock:
+            if _transfer_executor is None:
+                _transfer_executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('AWS_UPLOAD_WORKERS', 4),
+                    thread_name_prefix='s3-upload')
+            executor = _transfer_executor
+    return executor
+
+
+def get_transfer_config():
+    config = current_app.config
+    return TransferConfig(
+        multipart_threshold=config.get('AWS_MULTIPART_THRESHOLD', 8 * 1024 * 1024),
+        multipart_chunksize=config.get('AWS_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024),
+        max_concurrency=config.get('AWS_MAX_CONCURRENCY', 10))
+
+
+class S3MultipartWriter:
+    def __init__(self, client, bucket, key, part_size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+
+    def _upload_part(self, data):
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self.upload_id = response['UploadId']
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key,
+                                           UploadId=self.upload_id,
+                                           PartNumber=number, Body=data)
+        self.parts.append({'PartNumber': number, 'ETag': response['ETag']})
+
+    def complete(self):
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key,
+                                   Body=bytes(self.buffer))
+        else:
+            if self.buffer:
+                self._upload_part(bytes(self.buffer))
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                  UploadId=self.upload_id,
+                                                  MultipartUpload={'Parts': self.parts})
+        self.buffer = bytearray()
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                               UploadId=self.upload_id)
+        self.buffer = bytearray()
+
+
+class S3Storage:
+    @classmethod
+    def from_config(cls, config):
+        return cls()
+
+    @property
+    def client(self):
+        return get_s3_client()
+
+    def get_url(self, bucket, key, expires):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=expires)
+
+    def open_writer(self, bucket, key, part_size):
+        return S3MultipartWriter(self.client, bucket, key, part_size)
+
+    def _timed_upload(self, client, source, bucket, key, transfer_config):
+        start = time.perf_counter()
+        if isinstance(source, str):
+            client.upload_file(Filename=source, Bucket=bucket, Key=key, Config=transfer_config)
+        else:
+            client.upload_fileobj(Fileobj=source, Bucket=bucket, Key=key, Config=transfer_config)
+        return time.perf_counter() - start
+
+    def upload_many(self, bucket, objects):
+        client = self.client
+        transfer_config = get_transfer_config()
+        executor = get_transfer_executor()
+        futures = {key: executor.submit(self._timed_upload, client, source, bucket, key,
+                                        transfer_config)
+                   for key, source in objects.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+    def download_fileobj(self, bucket, key, fileobj):
+        self.client.download_fileobj(Bucket=bucket, Key=key, Fileobj=fileobj)
+
+    def iter_object(self, bucket, key, chunk_size):
+        body = self.client.get_object(Bucket=bucket, Key=key)['Body']
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete_objects(self, bucket, keys):
+        self.client.delete_objects(Bucket=bucket,
+                                   Delete={'Objects': [{'Key': key} for key in keys],
+                                           'Quiet': True})
+
+    def send(self, bucket, key):
+        return redirect(get_presigned_urls([(bucket, key, None)])[(bucket, key, None)])
+
+
+class LocalWriter:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False)
+
+    def write(self, data):
+        self.file.write(data)
+
+    def complete(self):
+        self.file.close()
+        os.replace(self.file.name, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.isfile(self.file.name):
+            os.remove(self.file.name)
+
+
+class LocalStorage:
+    def __init__(self, root, accel_prefix=None, max_age=86400):
+        self.root = root
+        self.accel_prefix = accel_prefix
+        self.max_age = max_age
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['LOCAL_STORAGE_ROOT'],
+                   accel_prefix=config.get('LOCAL_STORAGE_ACCEL_PREFIX'),
+                   max_age=config.get('LOCAL_STORAGE_MAX_AGE', 86400))
+
+    def get_path(self, bucket, key):
+        path = safe_join(self.root, bucket, key)
+        if path is None:
+            raise ValueError('Invalid object key: {}/{}'.format(bucket, key))
+        return path
+
+    def get_url(self, bucket, key, expires):
+        return url_for('gallery.media_file', bucket=bucket, key=key)
+
+    def open_writer(self, bucket, key, part_size):
+        return LocalWriter(self.get_path(bucket, key))
+
+    def upload_many(self, bucket, objects):
+        timings = {}
+        for key, source in objects.items():
+            start = time.perf_counter()
+            writer = LocalWriter(self.get_path(bucket, key))
+            try:
+                if isinstance(source, str):
+                    with open(source, 'rb') as file:
+                        shutil.copyfileobj(file, writer.file)
+                else:
+                    shutil.copyfileobj(source, writer.file)
+                writer.complete()
+            except Exception:
+                writer.abort()
+                raise
+            timings[key] = time.perf_counter() - start
+        return timings
+
+    def download_fileobj(self, bucket, key, fileobj):
+        with open(self.get_path(bucket, key), 'rb') as file:
+            shutil.copyfileobj(file, fileobj)
+
+    def iter_object(self, bucket, key, chunk_size):
+        with open(self.get_path(bucket, key), 'rb') as file:
+            yield from iter(lambda: file.read(chunk_size), b'')
+
+    def delete_objects(self, bucket, keys):
+        for key in keys:
+            path = self.get_path(bucket, key)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def send(self, bucket, key):
+        try:
+            path = self.get_path(bucket, key)
+        except ValueError:
+            abort(404)
+        if not os.path.isfile(path):
+            abort(404)
+        if self.accel_prefix:
+            response = make_response('')
+            response.headers['X-Accel-Redirect'] = '/'.join([self.accel_prefix.rstrip('/'),
+                                                             bucket, key])
+            response.headers['Cache-Control'] = 'public, max-age={}'.format(self.max_age)
+            return response
+        return send_file(path, max_age=self.max_age, conditional=True, etag=True)
+
+
+BACKENDS = {'s3': S3Storage, 'local': LocalStorage}
+
+
+def get_storage():
+    global _storage
+    storage = _storage
+    if storage is None:
+        with _lock:
+            if _storage is None:
+                config = current_app.config
+                backend = BACKENDS[config.get('STORAGE_BACKEND', 's3')]
+                _storage = backend.from_config(config)
+            storage = _storage
+    return storage
+
+
+def default_bucket():
+    config = current_app.config
+    return config.get('STORAGE_BUCKET') or config['AWS_BUCKET_NAME']
+
+
+def variant_key(key, variant=None):
+    if not variant:
+        return key
+    variant, _, extension = variant.partition('.')
+    if extension:
+        key = os.path.splitext(key)[0] + '.' + extension
+    return variant + '_' + key
+
+
+def get_presigned_urls(objects):
+    expires = current_app.config.get('AWS_PRESIGN_EXPIRES', 3600)
+    timeout = max(expires - current_app.config.get('AWS_PRESIGN_MARGIN', 300), 1)
+    objects = list(dict.fromkeys(objects))
+    cache_keys = ['presign:{}:{}:{}'.format(bucket, key, variant or '')
+                  for bucket, key, variant in objects]
+    cached = cache.get_many(*cache_keys) if cache_keys else []
+    storage = get_storage()
+    urls = {}
+    signed = {}
+    for obj, cache_key, url in zip(objects, cache_keys, cached):
+        if url is None:
+            bucket, key, variant = obj
+            url = storage.get_url(bucket, variant_key(key, variant), expires)
+            signed[cache_key] = url
+        urls[obj] = url
+    if signed:
+        cache.set_many(signed, timeout=timeout)
+    return urls
+
+
+def open_writer(bucket, key, part_size):
+    return get_storage().open_writer(bucket, key, part_size)
+
+
+def upload_many(bucket, objects):
+    timings = get_storage().upload_many(bucket, objects)
+    for key, elapsed in timings.items():
+        current_app.logger.info('Uploaded %s/%s in %.3fs', bucket, key, elapsed)
+    return timings
+
+
+def download_fileobj(bucket, key, fileobj):
+    get_storage().download_fileobj(bucket, key, fileobj)
+
+
+def iter_object(bucket, key, chunk_size=1024 * 1024):
+    return get_storage().iter_object(bucket, key, chunk_size)
+
+
+def delete_objects(bucket, keys):
+    get_storage().delete_objects(bucket, keys)
+
+
+def send_object(bucket, key):
+    return get_storage().send(bucket, key)
@@ -0,0 +1,135 @@
+import io
+import os
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from flask import current_app
+
+from app import db
+from app.gallery import media, storage
+from app.gallery.models import Attachment
+
+_lock = threading.Lock()
+_executor = None
+_worker_app = None
+
+
+def _reset_after_fork():
+    global _lock, _executor
+    _lock = threading.Lock()
+    _executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _init_worker(config):
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(type('WorkerConfig', (), config))
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                config = current_app.config
+                worker_config = {k: v for k, v in config.items() if k.isupper()}
+                context = multiprocessing.get_context(
+                    config.get('MEDIA_WORKER_START_METHOD', 'spawn'))
+                _executor = ProcessPoolExecutor(
+                    max_workers=config.get('MEDIA_WORKERS') or os.cpu_count(),
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(worker_config,))
+    return _executor
+
+
+def enqueue(attachment_id, data=None, path=None):
+    if current_app.config.get('MEDIA_TASKS_EAGER'):
+        future = Future()
+        future.set_result(process_attachment(attachment_id, data, path))
+        return future
+    logger = current_app.logger
+
+    def log_failure(future):
+        if future.exception() is not None:
+            logger.error('Media job for attachment %s failed: %s',
+                         attachment_id, future.exception())
+
+    future = get_executor().submit(run_job, attachment_id, data, path)
+    future.add_done_callback(log_failure)
+    return future
+
+
+def enqueue_pending(include_failed=False):
+    config = current_app.config
+    Attachment.release_stale(config.get('MEDIA_CLAIM_TIMEOUT', 3600),
+                             config.get('MEDIA_MAX_ATTEMPTS', 3))
+    states = ['pending', 'failed'] if include_failed else ['pending']
+    items = (db.session.query(Attachment.id)
+             .filter(Attachment.state.in_(states),
+                     Attachment.no_active.is_(False))
+             .order_by(Attachment.id))
+    return [enqueue(i.id) for i in items]
+
+
+def run_job(attachment_id, data=None, path=None):
+    with _worker_app.app_context():
+        return process_attachment(attachment_id, data, path)
+
+
+def process_attachment(attachment_id, data=None, path=None):
+    max_attempts = current_app.config.get('MEDIA_MAX_ATTEMPTS', 3)
+    if not Attachment.claim(attachment_id, max_attempts):
+        return False
+    attachment = db.session.get(Attachment, attachment_id)
+    try:
+        if path is not None:
+            attachment.aws_upload_file(path)
+            if not attachment.is_video:
+                with open(path, 'rb') as file:
+                    data = file.read()
+        obsolete_keys = process_media(attachment, data)
+        attachment.state = 'ready'
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Processing of attachment %s failed', attachment_id)
+        Attachment.query.filter_by(id=attachment_id).update({'state': 'failed'})
+        db.session.commit()
+        return False
+    if obsolete_keys:
+        storage.delete_objects(attachment.path, obsolete_keys)
+    return True
+
+
+def process_media(attachment, data=None):
+    if not attachment.is_video:
+        if data is None:
+            source = io.BytesIO()
+            attachment.aws_download_fileobj(source)
+            source.seek(0)
+        else:
+            source = io.BytesIO(data)
+        attachment.create_variants(source)
+        return []
+    original_key = attachment.name
+    with tempfile.TemporaryDirectory(dir=current_app.config.get('MEDIA_TEMP_FOLDER')) as directory:
+        path = os.path.join(directory, original_key)
+        with open(path, 'wb') as file:
+            attachment.aws_download_fileobj(file)
+        output = os.path.join(directory, 'output')
+        os.mkdir(output)
+        path_mp4, poster = media.process_video(path, output)
+        if path_mp4 != path:
+            attachment.name = os.path.basename(path_mp4)
+            attachment.aws_upload_file(path_mp4)
+        attachment.create_variants(poster)
+    if attachment.name != original_key:
+        return [original_key]
+    return []
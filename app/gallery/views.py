@@ -1,30 +1,201 @@
-import os
+import io
+import time
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
 
-from PIL import Image
-import moviepy.editor as moviepy
-from flask import render_template, url_for, redirect, request, flash, send_file, current_app
-from fpdf import FPDF
+from flask import (render_template, url_for, redirect, request, flash, send_file, abort,
+                   Response, stream_with_context, current_app, jsonify, session, make_response)
+from flask_login import current_user
+
+from sqlalchemy.orm import selectinload
 
 from app import db
-from app.gallery import bp
+from app.gallery import bp, tasks, storage, pdf, search, fragments, export, bulk
+from app.gallery.ingest import UploadStream
 from app.gallery.forms import (UploadForm, ArtworkForm, FeatureForm, FeaturesValueForm,
                                ClientForm, StatusForm, SelectTemplateForm, AttachmentForm, TagForm,
-                               ArtworkTypeForm, OfferForm)
-from app.gallery.models import Artwork, Attachment, Feature, Client, Status, Tag, ArtworkType, Offer
+                               ArtworkTypeForm, OfferForm, SearchForm, ArtworkTagForm)
+from app.gallery.models import (Entity, Artwork, Attachment, Feature, FeaturesValue, Client, Status,
+                                Tag, ArtworkType, Offer)
+
+CHOICE_ENTITIES = ['artwork', 'client', 'status', 'tag', 'feature', 'artwork_type']
+
+
+def validators(parts):
+    config = current_app.config
+    epoch_length = config.get('CONDITIONAL_GET_EPOCH', config.get('AWS_PRESIGN_MARGIN', 300))
+    epoch = int(time.time() // epoch_length)
+    value = repr((parts, epoch, current_user.get_id(), request.full_path))
+    etag = hashlib.sha1(value.encode()).hexdigest()
+    timestamps = [p for p in parts if isinstance(p, datetime)]
+    timestamps.append(datetime.utcfromtimestamp(epoch * epoch_length))
+    return etag, max(timestamps).replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(validator):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+            parts = validator(*args, **kwargs)
+            if parts is None:
+                return view(*args, **kwargs)
+            etag, last_modified = validators(parts)
+            if is_not_modified(etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+def list_validator(cls, data_search=None, related=()):
+    return cls.get_validator(data_search=data_search) + tuple(r.get_last_update() for r in related)
+
+
+def feature_search():
+    pairs = search.parse_feature_filters(request.args.getlist('feature_id'),
+                                         request.args.getlist('value'))
+    return pairs, [Artwork.id.in_(search.feature_filter(pairs))] if pairs else None
+
+
+def tag_search(id=None):
+    tag_ids = request.args.getlist('tag_id', type=int)
+    if id:
+        tag_ids.append(id)
+    match_all = request.args.get('mode') == 'and'
+    return tag_ids, match_all, [Artwork.tag_filter(tag_ids, match_all)] if tag_ids else None
+
+
+def page_args():
+    return {'keyset': True,
+            'cursor': request.args.get('cursor'),
+            'sort': request.args.get('sort'),
+            'sort_mode': request.args.get('order')}
+
+
+@bp.app_template_global()
+def page_url(page, cursor=None):
+    args = request.args.to_dict(flat=False)
+    args.pop('cursor', None)
+    args.update(sort=page.sort, order=page.sort_mode)
+    if cursor:
+        args['cursor'] = cursor
+    return url_for(request.endpoint, **request.view_args, **args)
+
+
+def lookup_choices(cls, id):
+    choices = [(0, '-Select-')]
+    if id and str(id).isdigit():
+        choices.extend(cls.get_choices(ids=[int(id)]))
+    return choices
+
+
+def render_cards(items):
+    images = [i.main_image for i in items if i.main_image and i.main_image.is_ready]
+    urls = Attachment.get_public_urls(images, thumbnail=True)
+    sources = Attachment.get_picture_sources(images)
+    return {i.id: render_template('_artwork_card.html', item=i, urls=urls, sources=sources)
+            for i in items}
+
+
+def render_detail(artwork):
+    data_filter = {'type_id': artwork.type_id}
+    artwork_features = Feature.get_items(data_filter=data_filter)
+    features_values = {f.feature_id: f.value for f in artwork.features_values}
+    thumb_urls = Attachment.get_public_urls([f for f in artwork.files
+                                             if f.is_ready and f.has_thumbnail],
+                                            thumbnail=True)
+    main_url = None
+    main_sources = []
+    if artwork.main_image and artwork.main_image.is_ready:
+        main_url = artwork.main_image.get_aws_public_url()
+        main_sources = Attachment.get_picture_sources([artwork.main_image])[artwork.main_image.id]
+    return render_template('_artwork_detail.html',
+                           item=artwork,
+                           main_url=main_url,
+                           main_sources=main_sources,
+                           thumb_urls=thumb_urls,
+                           features=artwork_features,
+                           values=features_values)
+
+
+def artwork_cards(items):
+    return fragments.render_many('card', list(items), render_cards)
 
 
 @bp.route('/')
 @bp.route('/index/')
+@conditional(lambda: list_validator(Artwork, related=[Attachment]))
 def index():
-    items = Artwork.get_items()
+    items = Artwork.get_pagination(**page_args())
     return render_template('index.html',
                            items=items,
+                           cards=artwork_cards(items),
                            title='Collection')
 
 
+@bp.route('/artworks/search/')
+@conditional(lambda: list_validator(Artwork, data_search=feature_search()[1],
+                                    related=[Attachment, FeaturesValue, Feature]))
+def artwork_search():
+    form = SearchForm(request.args)
+    form.feature_id.choices = Feature.get_items(tuple_mode=True)
+    pairs, data_search = feature_search()
+    items = Artwork.get_pagination(data_search=data_search, **page_args())
+    features = {f.id: f.name for f in Feature.query.filter(Feature.id.in_([p[0] for p in pairs]))}
+    return render_template('artwork_search.html',
+                           form=form,
+                           filters=[(f, features.get(f), v) for f, v in pairs],
+                           filter_ids=[f for f, v in pairs],
+                           filter_values=[v for f, v in pairs],
+                           facets=search.feature_facets(pairs),
+                           items=items,
+                           cards=artwork_cards(items),
+                           title='Artworks search')
+
+
+@bp.route('/search/')
+def search_results():
+    terms = request.args.get('q', '').strip()
+    items = search.search(terms, limit=current_app.config.get('SEARCH_LIMIT', 50)) if terms else []
+    return render_template('search.html',
+                           items=items,
+                           terms=terms,
+                           title='Search')
+
+
+@bp.route('/choices/<entity>/')
+def choices(entity):
+    if entity not in CHOICE_ENTITIES:
+        abort(404)
+    cls = Entity.get_class(entity)
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    items = cls.get_choices(prefix=request.args.get('q', '').strip(), limit=limit)
+    return jsonify([{'id': i, 'name': name} for i, name in items])
+
+
 @bp.route('/features/')
+@conditional(lambda: list_validator(Feature, related=[ArtworkType]))
 def features():
-    items = Feature.get_items()
+    items = Feature.get_pagination(**page_args())
     return render_template('features.html',
                            items=items,
                            title='Features')
@@ -127,16 +298,40 @@ def artwork_create():
 
 
 @bp.route('/artworks/view/<id>', methods=['GET', 'POST'])
+@conditional(Artwork.get_view_validator)
 def artwork_view(id):
-    artwork = Artwork.get_object(id)
-    data_filter = {'type_id': artwork.type_id}
-    artwork_features = Feature.get_items(data_filter=data_filter)
-    features_values = {f.feature_id: f.value for f in artwork.features_values}
+    artwork = Artwork.get_object(id, options=[selectinload(Artwork.tags)])
+    tag_form = ArtworkTagForm()
+    tag_form.tag_id.choices = [t for t in Tag.get_items(tuple_mode=True)
+                               if t[0] not in {tag.id for tag in artwork.tags}]
     return render_template('artwork_view.html',
                            title='Artwork (view)',
                            item=artwork,
-                           features=artwork_features,
-                           values=features_values)
+                           detail=fragments.render_one('artwork', artwork,
+                                                       lambda: render_detail(artwork)),
+                           tag_form=tag_form)
+
+
+@bp.route('/artworks/<id>/tags/', methods=['POST'])
+def artwork_tag_add(id):
+    artwork = Artwork.get_object(id)
+    form = ArtworkTagForm()
+    form.tag_id.choices = Tag.get_items(tuple_mode=True)
+    if form.validate_on_submit():
+        tag = Tag.get_object(form.tag_id.data, mode_404=False)
+        if tag:
+            artwork.add_tag(tag)
+            db.session.commit()
+    return redirect(url_for('gallery.artwork_view', id=id))
+
+
+@bp.route('/artworks/<id>/tags/delete/<tag_id>', methods=['GET', 'POST'])
+def artwork_tag_delete(id, tag_id):
+    artwork = Artwork.get_object(id)
+    tag = Tag.get_object(tag_id)
+    artwork.delete_tag(tag)
+    db.session.commit()
+    return redirect(url_for('gallery.artwork_view', id=id))
 
 
 @bp.route('/artworks/edit/<id>', methods=['GET', 'POST'])
@@ -173,11 +368,25 @@ def artwork_delete(id):
 
 
 @bp.route('/attachments/view/<id>', methods=['GET', 'POST'])
+@conditional(lambda id: Attachment.get_validator(data_filter={'id': id}))
 def attachment_view(id):
     attachment = Attachment.get_object(id)
+    sources = Attachment.get_picture_sources([attachment])[attachment.id]
+    poster_url = None
+    if attachment.is_video and attachment.has_thumbnail:
+        poster_url = attachment.get_aws_public_url(thumbnail=True)
     return render_template('attachment_view.html',
                            title='Attachment (view)',
-                           item=attachment)
+                           item=attachment,
+                           sources=sources,
+                           poster_url=poster_url)
+
+
+@bp.route('/media/<bucket>/<path:key>')
+def media_file(bucket, key):
+    if bucket != storage.default_bucket() or not Attachment.find_by_key(bucket, key):
+        abort(404)
+    return storage.send_object(bucket, key)
 
 
 @bp.route('/attachments/edit/<id>', methods=['GET', 'POST'])
@@ -210,28 +419,43 @@ def create_pdf(artwork_id):
     form = SelectTemplateForm()
     artwork = Artwork.get_object(artwork_id)
     if form.validate_on_submit():
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-        template = form.template.data
-        if template == '0':
-            pdf.image(artwork.main_image.get_aws_public_url(thumbnail=True),
-                      x=10, y=8, w=100)
-            pdf.ln(80)
-        pdf.cell(200, 10, txt="{}".format(artwork.author), ln=1)
-        pdf.ln(3)
-        pdf.cell(200, 10, txt="{}".format(artwork.year), ln=1)
-        pdf.ln(3)
-        pdf.cell(200, 10, txt="{}".format(artwork.info), ln=1)
-        if template == '1':
-            pdf.image(artwork.main_image.get_aws_public_url(thumbnail=True),
-                      x=10, y=58, w=100)
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], "image.pdf")
-        pdf.output(file_path, 'F')
-        return send_file(file_path, as_attachment=False)
+        data = pdf.get_sheet(artwork, form.template.data)
+        return send_file(io.BytesIO(data), mimetype='application/pdf',
+                         download_name='artwork_{}.pdf'.format(artwork.id),
+                         as_attachment=False)
     return render_template('data_form.html', form=form)
 
 
+@bp.route('/artworks/catalog/')
+def export_catalog():
+    output_format = request.args.get('format', 'pdf')
+    chunk_size = request.args.get('chunk_size', 50, type=int)
+    if output_format not in ('pdf', 'zip') or chunk_size < 1:
+        abort(400)
+    query = pdf.catalog_query(type_id=request.args.get('type_id', type=int),
+                              tag_ids=request.args.getlist('tag_id', type=int),
+                              status_id=request.args.get('status_id', type=int))
+    data = pdf.export_catalog(query, output_format=output_format,
+                              chunk_size=chunk_size)
+    mimetype = 'application/pdf' if output_format == 'pdf' else 'application/zip'
+    filename = 'catalog.{}'.format(output_format)
+    return Response(stream_with_context(data), mimetype=mimetype,
+                    headers={'Content-Disposition': 'attachment; filename=' + filename})
+
+
+@bp.route('/export/<entity>.<output_format>')
+def export_data(entity, output_format):
+    if entity not in export.QUERIES or output_format not in export.FORMATS:
+        abort(404)
+    batch_size = request.args.get('batch_size', type=int)
+    if batch_size is not None and batch_size < 1:
+        abort(400)
+    data = export.export_rows(entity, output_format, batch_size=batch_size)
+    filename = '{}.{}'.format(entity, output_format)
+    return Response(stream_with_context(data), mimetype=export.FORMATS[output_format],
+                    headers={'Content-Disposition': 'attachment; filename=' + filename})
+
+
 @bp.route('/artworks/<artwork_id>/upload_file/', methods=['GET', 'POST'])
 def file_upload(artwork_id):
     # bucket = s3_client.create_bucket(Bucket='11-87.tech-test',
@@ -251,40 +475,29 @@ def file_upload(artwork_id):
         if file.filename == '':
             flash('No selected file')
             return redirect(url_for('gallery.file_upload', artwork_id=artwork_id))
-        directory = os.path.join(current_app.config['UPLOAD_FOLDER'])
-        if not os.path.exists(directory):
-            os.mkdir(directory)
-        extension = os.path.splitext(file.filename)[1]
-        filename = Attachment.create_file_name(artwork, extension)
-        path = os.path.join(directory, filename)
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-        file.save(path)
+        stream = file.stream
+        if not isinstance(stream, UploadStream):
+            abort(400)
         attachment = Attachment(artwork_id=artwork_id,
-                                name=filename,
-                                path=current_app.config['AWS_BUCKET_NAME'])
+                                name=stream.key,
+                                path=stream.bucket,
+                                hash=stream.hexdigest,
+                                state='pending')
+        original = Attachment.find_by_hash(stream.hexdigest)
+        if original:
+            stream.close()
+            attachment.copy_content(original)
+        else:
+            stream.complete()
         db.session.add(attachment)
         db.session.flush()
-        if extension not in ['.avi', '.mov', '.mp4', '.webm']:
-            img = Image.open(path)
-            img.thumbnail(size=(300, 500))
-            path_thumb = os.path.join(directory, 'thumb_' + filename)
-            img.save(path_thumb)
-            attachment.aws_upload_file(path_thumb, thumbnail=True)
-            attachment.aws_upload_file(path)
-            if os.path.isfile(path_thumb):
-                os.remove(path_thumb)
-        elif not extension == '.mp4':
-            clip = moviepy.VideoFileClip(path)
-            path_mp4 = path.replace(extension, '.mp4')
-            clip.write_videofile(path_mp4)
-            attachment.name = filename.replace(extension, '.mp4')
-            attachment.aws_upload_file(path_mp4)
-            if os.path.isfile(path_mp4):
-                os.remove(path_mp4)
+        main = artwork.main_attachment
+        if main is None or (main.is_video and not attachment.is_video):
+            attachment.set_main_image()
         db.session.commit()
-        if os.path.isfile(path):
-            os.remove(path)
+        if not attachment.is_ready:
+            image_data = bytes(stream.image_data) if stream.image_data is not None else None
+            tasks.enqueue(attachment.id, data=image_data)
         return redirect(url_back)
     return render_template('data_form.html',
                            title='File upload',
@@ -292,8 +505,9 @@ def file_upload(artwork_id):
 
 
 @bp.route('/clients/')
+@conditional(lambda: list_validator(Client))
 def clients():
-    items = Client.get_items()
+    items = Client.get_pagination(**page_args())
     return render_template('clients.html',
                            items=items,
                            title='Clients')
@@ -348,6 +562,7 @@ def client_delete(id):
 
 
 @bp.route('/statuses/')
+@conditional(lambda: list_validator(Status))
 def statuses():
     items = Status.get_items()
     return render_template('statuses.html',
@@ -398,13 +613,32 @@ def status_delete(id):
 
 
 @bp.route('/tags/')
+@conditional(lambda: list_validator(Tag))
 def tags():
-    items = Tag.get_items()
+    items = Tag.get_pagination(**page_args())
     return render_template('tags.html',
                            items=items,
                            title='Tags')
 
 
+@bp.route('/tags/artworks/')
+@bp.route('/tags/<int:id>/artworks/')
+@conditional(lambda id=None: list_validator(Artwork, data_search=tag_search(id)[2],
+                                           related=[Attachment, Tag]))
+def tag_artworks(id=None):
+    tag_ids, match_all, data_search = tag_search(id)
+    if not tag_ids:
+        return redirect(url_for('gallery.tags'))
+    items = Artwork.get_pagination(data_search=data_search, **page_args())
+    return render_template('tag_artworks.html',
+                           tags=Tag.query.filter(Tag.id.in_(tag_ids)).order_by(Tag.name).all(),
+                           tag_ids=sorted(set(tag_ids)),
+                           match_all=match_all,
+                           items=items,
+                           cards=artwork_cards(items),
+                           title='Tagged artworks')
+
+
 @bp.route('/tags/create/', methods=['GET', 'POST'])
 def tag_create():
     form = TagForm()
@@ -448,6 +682,7 @@ def tag_delete(id):
 
 
 @bp.route('/artwork_types/')
+@conditional(lambda: list_validator(ArtworkType))
 def artwork_types():
     items = ArtworkType.get_items()
     return render_template('artwork_types.html',
@@ -498,8 +733,9 @@ def artwork_type_delete(id):
 
 
 @bp.route('/offers/')
+@conditional(lambda: list_validator(Offer, related=[Artwork, Client, Status]))
 def offers():
-    items = Offer.get_items()
+    items = Offer.get_pagination(**page_args())
     return render_template('offers.html',
                            items=items,
                            title='Offers')
@@ -508,8 +744,8 @@ def offers():
 @bp.route('/offers/create/', methods=['GET', 'POST'])
 def offer_create():
     form = OfferForm()
-    form.client_id.choices = Client.get_items(tuple_mode=True)
-    form.artwork_id.choices = Artwork.get_items(tuple_mode=True)
+    form.client_id.choices = lookup_choices(Client, form.client_id.data)
+    form.artwork_id.choices = lookup_choices(Artwork, form.artwork_id.data)
     form.status_id.choices = Status.get_items(tuple_mode=True)
     if request.method == 'POST':
         if form.cancel.data:
@@ -531,10 +767,10 @@ def offer_create():
 @bp.route('/offers/edit/<id>', methods=['GET', 'POST'])
 def offer_edit(id):
     form = OfferForm()
-    form.client_id.choices = Client.get_items(tuple_mode=True)
-    form.artwork_id.choices = Artwork.get_items(tuple_mode=True)
-    form.status_id.choices = Status.get_items(tuple_mode=True)
     offer = Offer.get_object(id)
+    form.client_id.choices = lookup_choices(Client, form.client_id.data or offer.client_id)
+    form.artwork_id.choices = lookup_choices(Artwork, form.artwork_id.data or offer.artwork_id)
+    form.status_id.choices = Status.get_items(tuple_mode=True)
     if request.method == 'POST':
         if form.cancel.data:
             return redirect(url_for('gallery.offers'))
@@ -562,3 +798,80 @@ def offer_delete(id):
     db.session.delete(offer)
     db.session.commit()
     return redirect(url_for('gallery.offers'))
+
+
+def bulk_values(name):
+    data = request.get_json(silent=True)
+    if data is None:
+        return request.form.getlist(name)
+    if not isinstance(data, dict):
+        abort(400)
+    value = data.get(name)
+    if value is None:
+        return []
+    return [str(v) for v in (value if isinstance(value, list) else [value])]
+
+
+def bulk_ints(name):
+    values = bulk_values(name)
+    if not all(v.isdigit() for v in values):
+        abort(400)
+    return [int(v) for v in values]
+
+
+def bulk_selection(cls, criteria=()):
+    ids = bulk_ints('id') or None
+    criteria = [c for c in criteria if c is not None]
+    if ids is None and not criteria:
+        abort(400)
+    return bulk.selection(cls, ids, criteria)
+
+
+def artwork_selection():
+    type_ids = bulk_ints('type_id')
+    tag_ids = bulk_ints('filter_tag_id')
+    pairs = search.parse_feature_filters(bulk_values('feature_id'), bulk_values('value'))
+    features = Artwork.id.in_(search.feature_filter(pairs)) if pairs else None
+    return bulk_selection(Artwork, [Artwork.type_id.in_(type_ids) if type_ids else None,
+                                    Artwork.tag_filter(tag_ids) if tag_ids else None,
+                                    features])
+
+
+def offer_selection():
+    status_ids = bulk_ints('from_status_id')
+    client_ids = bulk_ints('client_id')
+    artwork_ids = bulk_ints('artwork_id')
+    return bulk_selection(Offer, [Offer.status_id.in_(status_ids) if status_ids else None,
+                                  Offer.client_id.in_(client_ids) if client_ids else None,
+                                  Offer.artwork_id.in_(artwork_ids) if artwork_ids else None])
+
+
+@bp.route('/bulk/artworks/tags/', methods=['POST'])
+def bulk_artwork_tags():
+    tag_ids = bulk_ints('tag_id')
+    action = (bulk_values('action') or ['add'])[0]
+    if not tag_ids or action not in ('add', 'remove'):
+        abort(400)
+    operation = bulk.add_tags if action == 'add' else bulk.remove_tags
+    return jsonify(operation(artwork_selection(), tag_ids))
+
+
+@bp.route('/bulk/offers/status/', methods=['POST'])
+def bulk_offer_status():
+    status_ids = bulk_ints('status_id')
+    if len(status_ids) != 1 or not Status.get_object(status_ids[0], mode_404=False):
+        abort(400)
+    return jsonify(bulk.change_offer_status(offer_selection(), status_ids[0]))
+
+
+@bp.route('/bulk/<entity>/delete/', methods=['POST'])
+def bulk_delete(entity):
+    if entity not in bulk.SOFT_DELETE:
+        abort(404)
+    if entity == 'artwork':
+        ids = artwork_selection()
+    elif entity == 'offer':
+        ids = offer_selection()
+    else:
+        ids = bulk_selection(bulk.SOFT_DELETE[entity])
+    return jsonify(bulk.soft_delete(entity, ids))
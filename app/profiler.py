@@ -0,0 +1,107 @@
+import re
+import json
+import time
+import random
+import threading
+from collections import deque, Counter
+
+from flask import g, request, current_app, has_request_context, jsonify, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)')
+_spaces = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    statement = _literals.sub('?', statement)
+    statement = _in_lists.sub('(?)', statement)
+    return _spaces.sub(' ', statement).strip()
+
+
+class SQLProfiler:
+    def __init__(self, app=None):
+        self.profiles = deque(maxlen=100)
+        self.lock = threading.Lock()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_PROFILER_SAMPLE_RATE', 0.0)
+        app.config.setdefault('SQL_PROFILER_N1_THRESHOLD', 5)
+        app.config.setdefault('SQL_PROFILER_HEADER', 'X-SQL-Profile')
+        app.config.setdefault('SQL_PROFILER_DEBUG_ENDPOINT', app.debug)
+        app.config.setdefault('SQL_PROFILER_HISTORY', 100)
+        self.profiles = deque(maxlen=app.config['SQL_PROFILER_HISTORY'])
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule('/_debug/sql', 'sql_profiles', self.debug_view)
+
+    def _start(self):
+        config = current_app.config
+        forced = (config['SQL_PROFILER_DEBUG_ENDPOINT']
+                  and request.headers.get(config['SQL_PROFILER_HEADER']))
+        if forced or random.random() < config['SQL_PROFILER_SAMPLE_RATE']:
+            g._sql_profile = {'start': time.perf_counter(), 'queries': 0, 'db_time': 0.0,
+                              'statements': Counter()}
+
+    @staticmethod
+    def _current():
+        if has_request_context():
+            return g.get('_sql_profile')
+        return None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current() is not None:
+            conn.info.setdefault('_sql_profile_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = self._current()
+        if profile is None or not conn.info.get('_sql_profile_start'):
+            return
+        elapsed = time.perf_counter() - conn.info['_sql_profile_start'].pop()
+        profile['queries'] += 1
+        profile['db_time'] += elapsed
+        profile['statements'][fingerprint(statement)] += 1
+
+    def _finish(self, response):
+        profile = g.pop('_sql_profile', None)
+        if profile is None:
+            return response
+        threshold = current_app.config['SQL_PROFILER_N1_THRESHOLD']
+        repeated = [{'statement': s, 'count': c}
+                    for s, c in profile['statements'].most_common() if c > 1]
+        suspects = [r for r in repeated
+                    if r['count'] >= threshold and r['statement'].upper().startswith('SELECT')]
+        result = {'method': request.method,
+                  'path': request.path,
+                  'endpoint': request.endpoint,
+                  'status': response.status_code,
+                  'queries': profile['queries'],
+                  'db_time_ms': round(profile['db_time'] * 1000, 2),
+                  'total_time_ms': round((time.perf_counter() - profile['start']) * 1000, 2),
+                  'repeated': repeated[:10],
+                  'n_plus_one': suspects}
+        response.headers['X-SQL-Queries'] = str(result['queries'])
+        response.headers['X-SQL-Time'] = '{:.2f}ms'.format(result['db_time_ms'])
+        if suspects:
+            response.headers['X-SQL-N-Plus-One'] = str(len(suspects))
+            current_app.logger.warning('sql_profile %s', json.dumps(result))
+        else:
+            current_app.logger.info('sql_profile %s', json.dumps(result))
+        with self.lock:
+            self.profiles.append(result)
+        return response
+
+    def debug_view(self):
+        if not current_app.config['SQL_PROFILER_DEBUG_ENDPOINT']:
+            abort(404)
+        with self.lock:
+            profiles = list(self.profiles)
+        return jsonify(profiles)
@@ -20,9 +20,9 @@ class Entity:
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), default='')
     no_active = db.Column(db.Boolean, default=False)
-    timestamp_create = db.Column(db.DateTime(), default=datetime.utcnow())
-    timestamp_update = db.Column(db.DateTime(), default=datetime.utcnow(),
-                                 onupdate=datetime.utcnow())
+    timestamp_create = db.Column(db.DateTime(), default=datetime.utcnow)
+    timestamp_update = db.Column(db.DateTime(), default=datetime.utcnow,
+                                 onupdate=datetime.utcnow)
 
     @staticmethod
     def get_class(class_name):
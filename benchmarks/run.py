@@ -0,0 +1,181 @@
+import os
+import io
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+from app import create_app, db
+from benchmarks import seed
+from config import Config
+
+
+def bench_config(workdir, database_url=None):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        STORAGE_BACKEND = 'local'
+        STORAGE_BUCKET = 'benchmark'
+        LOCAL_STORAGE_ROOT = os.path.join(workdir, 'storage')
+        MEDIA_TASKS_EAGER = True
+        WTF_CSRF_ENABLED = False
+        CACHE_TYPE = 'SimpleCache'
+        SQL_PROFILER_SAMPLE_RATE = 1.0
+        SQL_PROFILER_DEBUG_ENDPOINT = False
+    return BenchConfig
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def scenarios(volumes, image):
+    artworks = volumes['artworks']
+
+    def index(client, rnd):
+        return client.get('/index/')
+
+    def artwork_view(client, rnd):
+        return client.get('/artworks/view/{}'.format(rnd.randint(1, artworks)))
+
+    def offers(client, rnd):
+        return client.get('/offers/')
+
+    def file_upload(client, rnd):
+        data = {'file': (io.BytesIO(image + os.urandom(16)), 'benchmark.jpg'),
+                'submit': 'Submit'}
+        return client.post('/artworks/{}/upload_file/'.format(rnd.randint(1, artworks)),
+                           data=data, content_type='multipart/form-data')
+
+    def create_pdf(client, rnd):
+        return client.post('/artworks/{}/create_pdf/'.format(rnd.randint(1, artworks)),
+                           data={'template': str(rnd.randint(0, 1)), 'submit': 'Submit'})
+
+    return {'index': index,
+            'artwork_view': artwork_view,
+            'offers': offers,
+            'file_upload': file_upload,
+            'create_pdf': create_pdf}
+
+
+def measure(client, func, requests, warmup, rnd):
+    for _ in range(warmup):
+        func(client, rnd)
+    timings = []
+    queries = []
+    errors = 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = func(client, rnd)
+        response.get_data()
+        timings.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors += 1
+        if 'X-SQL-Queries' in response.headers:
+            queries.append(int(response.headers['X-SQL-Queries']))
+    return {'requests': requests,
+            'errors': errors,
+            'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+            'mean_ms': round(statistics.mean(timings) * 1000, 3),
+            'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+            'peak_rss_kb': peak_rss_kb()}
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as file:
+        baseline = json.load(file)['results']
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        print('{:14} p50 {:9.2f} -> {:9.2f} ms  p95 {:9.2f} -> {:9.2f} ms  '
+              'queries {} -> {}'.format(name, before['p50_ms'], result['p50_ms'],
+                                        before['p95_ms'], result['p95_ms'],
+                                        before['queries_per_request'],
+                                        result['queries_per_request']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gallery request benchmarks')
+    parser.add_argument('--preset', choices=sorted(seed.PRESETS), default='tiny')
+    for name in seed.PRESETS['tiny']:
+        parser.add_argument('--' + name.replace('_', '-'), type=int, dest=name,
+                            help='override the preset volume')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'gallery-bench'))
+    parser.add_argument('--database-url', help='benchmark against this database instead of SQLite')
+    parser.add_argument('--reuse', action='store_true',
+                        help='skip seeding when the work directory already holds this preset')
+    parser.add_argument('--scenario', action='append', help='run only these scenarios')
+    parser.add_argument('-n', '--requests', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='benchmark.json')
+    parser.add_argument('--baseline', help='previous result file to compare against')
+    args = parser.parse_args()
+
+    volumes = dict(seed.PRESETS[args.preset])
+    volumes.update({k: getattr(args, k) for k in volumes if getattr(args, k) is not None})
+    os.makedirs(args.workdir, exist_ok=True)
+    marker = os.path.join(args.workdir, 'volumes.json')
+    app = create_app(bench_config(args.workdir, args.database_url))
+    with app.app_context():
+        seeded = None
+        if args.reuse and os.path.exists(marker):
+            with open(marker) as file:
+                seeded = json.load(file)
+        if seeded is None or seeded['volumes'] != volumes:
+            start = time.perf_counter()
+            counts = seed.seed(volumes, app.config['STORAGE_BUCKET'], random_seed=args.seed)
+            seeded = {'volumes': volumes, 'rows': counts,
+                      'seconds': round(time.perf_counter() - start, 1)}
+            with open(marker, 'w') as file:
+                json.dump(seeded, file)
+            print('seeded {} rows in {}s'.format(sum(counts.values()), seeded['seconds']))
+        db.session.remove()
+
+    image = seed.sample_image()
+    client = app.test_client()
+    rnd = random.Random(args.seed)
+    results = {}
+    for name, func in scenarios(volumes, image).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        results[name] = measure(client, func, args.requests, args.warmup, rnd)
+        print('{:14} p50 {p50_ms:9.2f} ms  p95 {p95_ms:9.2f} ms  queries {queries_per_request}  '
+              'errors {errors}'.format(name, **results[name]))
+
+    report = {'revision': git_revision(),
+              'timestamp': datetime.utcnow().isoformat(),
+              'python': platform.python_version(),
+              'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+              'volumes': volumes,
+              'seed': seeded,
+              'results': results}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
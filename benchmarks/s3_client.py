@@ -0,0 +1,54 @@
+import argparse
+import time
+
+import boto3
+
+from app import create_app
+from app.gallery.storage import get_s3_client
+from config import Config
+
+
+class BenchConfig(Config):
+    AWS_KEY_ID = 'benchmark'
+    AWS_SECRET_KEY = 'benchmark'
+    AWS_REGION = 'eu-west-1'
+    AWS_BUCKET_NAME = 'benchmark'
+
+
+def presign_with_fresh_client(config, key):
+    client = boto3.client(service_name='s3',
+                          aws_access_key_id=config['AWS_KEY_ID'],
+                          aws_secret_access_key=config['AWS_SECRET_KEY'],
+                          region_name=config['AWS_REGION'])
+    return client.generate_presigned_url(
+        'get_object', Params={'Bucket': config['AWS_BUCKET_NAME'], 'Key': key})
+
+
+def presign_with_shared_client(config, key):
+    return get_s3_client().generate_presigned_url(
+        'get_object', Params={'Bucket': config['AWS_BUCKET_NAME'], 'Key': key})
+
+
+def measure(func, config, number):
+    start = time.perf_counter()
+    for i in range(number):
+        func(config, 'thumb_attachment_{}.jpg'.format(i))
+    return (time.perf_counter() - start) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-call S3 client overhead')
+    parser.add_argument('-n', '--number', type=int, default=200)
+    args = parser.parse_args()
+    app = create_app(BenchConfig)
+    with app.app_context():
+        config = app.config
+        fresh = measure(presign_with_fresh_client, config, args.number)
+        shared = measure(presign_with_shared_client, config, args.number)
+    print('fresh client:  {:8.1f} us/call'.format(fresh * 1e6))
+    print('shared client: {:8.1f} us/call'.format(shared * 1e6))
+    print('speedup:       {:8.1f}x'.format(fresh / shared))
+
+
+if __name__ == '__main__':
+    main()
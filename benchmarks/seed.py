@@ -0,0 +1,147 @@
+import io
+import random
+
+from PIL import Image
+
+from app import db
+from app.gallery import storage
+from app.gallery.models import (artworks_tags, Artwork, ArtworkType, Attachment, Client, Feature,
+                                FeaturesValue, Offer, Status, Tag)
+
+PRESETS = {
+    'tiny': {'artworks': 200, 'attachments': 1000, 'clients': 100, 'offers': 2000,
+             'types': 3, 'features': 10, 'tags': 20, 'tags_per_artwork': 3},
+    'small': {'artworks': 10000, 'attachments': 100000, 'clients': 1000, 'offers': 50000,
+              'types': 5, 'features': 20, 'tags': 100, 'tags_per_artwork': 3},
+    'full': {'artworks': 100000, 'attachments': 1000000, 'clients': 10000, 'offers': 500000,
+             'types': 5, 'features': 50, 'tags': 1000, 'tags_per_artwork': 5},
+}
+
+SAMPLE_KEY = 'attachment_benchmark_sample.jpg'
+SAMPLE_VARIANTS = 'w480.webp,thumb'
+FEATURE_VALUES = 12
+
+
+def sample_image(width=1600, height=1200):
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def store_sample(bucket):
+    data = sample_image()
+    thumb = io.BytesIO()
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((300, 500))
+    image.save(thumb, 'JPEG')
+    thumb.seek(0)
+    storage.upload_many(bucket, {SAMPLE_KEY: io.BytesIO(data),
+                                 storage.variant_key(SAMPLE_KEY, 'thumb'): thumb})
+    return data
+
+
+def insert_batches(model, rows, batch_size):
+    batch = []
+    total = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(db.insert(model), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+        total += len(batch)
+    db.session.commit()
+    return total
+
+
+def seed(volumes, bucket, batch_size=5000, random_seed=0):
+    rnd = random.Random(random_seed)
+    db.drop_all()
+    db.create_all()
+    store_sample(bucket)
+    counts = {}
+
+    types = volumes['types']
+    counts['artwork_type'] = insert_batches(
+        ArtworkType, ({'id': i, 'name': 'Type {}'.format(i)} for i in range(1, types + 1)),
+        batch_size)
+    features = [(t, (t - 1) * volumes['features'] + f)
+                for t in range(1, types + 1) for f in range(1, volumes['features'] + 1)]
+    counts['feature'] = insert_batches(
+        Feature, ({'id': f, 'type_id': t, 'name': 'Feature {}'.format(f)} for t, f in features),
+        batch_size)
+    features_by_type = {}
+    for t, f in features:
+        features_by_type.setdefault(t, []).append(f)
+    counts['status'] = insert_batches(
+        Status, ({'id': i, 'name': name} for i, name in enumerate(['New', 'Sent', 'Sold'], 1)),
+        batch_size)
+    counts['tag'] = insert_batches(
+        Tag, ({'id': i, 'name': 'tag{}'.format(i)} for i in range(1, volumes['tags'] + 1)),
+        batch_size)
+    counts['client'] = insert_batches(
+        Client, ({'id': i,
+                  'name': 'Client {}'.format(i),
+                  'phone': '+1555{:07d}'.format(i),
+                  'info': 'Benchmark client {}'.format(i)}
+                 for i in range(1, volumes['clients'] + 1)),
+        batch_size)
+
+    artworks = volumes['artworks']
+    artwork_types = [rnd.randint(1, types) for _ in range(artworks)]
+    counts['artwork'] = insert_batches(
+        Artwork, ({'id': i,
+                   'name': 'Artwork {}'.format(i),
+                   'type_id': artwork_types[i - 1],
+                   'author': 'Author {}'.format(rnd.randint(1, 500)),
+                   'year': str(rnd.randint(1850, 2023)),
+                   'buy_price': rnd.randint(100, 100000),
+                   'info': 'Benchmark artwork {}'.format(i)}
+                  for i in range(1, artworks + 1)),
+        batch_size)
+    artwork_features = ((i, f) for i in range(1, artworks + 1)
+                        for f in features_by_type[artwork_types[i - 1]])
+    counts['features_value'] = insert_batches(
+        FeaturesValue, ({'artwork_id': i,
+                         'feature_id': f,
+                         'value': 'v{}'.format(rnd.randint(1, FEATURE_VALUES))}
+                        for i, f in artwork_features),
+        batch_size)
+    counts['artworks_tags'] = insert_batches(
+        artworks_tags, ({'artwork_id': i, 'tag_id': t}
+                        for i in range(1, artworks + 1)
+                        for t in rnd.sample(range(1, volumes['tags'] + 1),
+                                            min(volumes['tags_per_artwork'], volumes['tags']))),
+        batch_size)
+    Tag.recount()
+
+    counts['attachment'] = insert_batches(
+        Attachment, ({'id': i,
+                      'artwork_id': (i - 1) % artworks + 1,
+                      'name': SAMPLE_KEY,
+                      'path': bucket,
+                      'state': 'ready',
+                      'variants': SAMPLE_VARIANTS,
+                      'main_image': i <= artworks}
+                     for i in range(1, volumes['attachments'] + 1)),
+        batch_size)
+    main_attachment = (db.select(db.func.min(Attachment.id))
+                       .where(Attachment.artwork_id == Artwork.id)
+                       .scalar_subquery())
+    db.session.execute(db.update(Artwork).values(main_attachment_id=main_attachment)
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+
+    counts['offer'] = insert_batches(
+        Offer, ({'id': i,
+                 'name': 'Offer {}'.format(i),
+                 'artwork_id': rnd.randint(1, artworks),
+                 'client_id': rnd.randint(1, volumes['clients']),
+                 'status_id': rnd.randint(1, 3),
+                 'price': rnd.randint(100, 100000)}
+                for i in range(1, volumes['offers'] + 1)),
+        batch_size)
+    return counts
@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+import pytest
+
+from app import create_app, db
+from app.gallery.models import ArtworkType
+from config import Config
+
+
+@pytest.fixture
+def app():
+    with tempfile.TemporaryDirectory() as workdir:
+        class TestConfig(Config):
+            TESTING = True
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'test.db')
+            STORAGE_BACKEND = 'local'
+            STORAGE_BUCKET = 'test'
+            LOCAL_STORAGE_ROOT = os.path.join(workdir, 'storage')
+            MEDIA_TASKS_EAGER = True
+            WTF_CSRF_ENABLED = False
+            CACHE_TYPE = 'SimpleCache'
+
+        app = create_app(TestConfig)
+        with app.app_context():
+            db.create_all()
+            yield app
+            db.session.remove()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def artwork_type(app):
+    artwork_type = ArtworkType(name='Painting')
+    db.session.add(artwork_type)
+    db.session.commit()
+    return artwork_type
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from app import db
+from app.gallery import bulk
+from app.gallery.models import Artwork, Client, Tag
+
+
+def test_add_tags_touches_only_new_links(artwork_type):
+    tag = Tag(name='oil')
+    artworks = [Artwork(name=str(i), type_id=artwork_type.id,
+                        timestamp_update=datetime(2020, 1, 1)) for i in range(4)]
+    db.session.add_all([tag, *artworks])
+    db.session.flush()
+    for artwork in artworks[:3]:
+        artwork.tags.append(tag)
+    db.session.commit()
+    ids = [a.id for a in artworks]
+    result = bulk.add_tags(bulk.selection(Artwork, ids), [tag.id])
+    assert result == {'artworks': 1, 'links': 1}
+    updated = [a.id for a in Artwork.query if a.timestamp_update > datetime(2020, 1, 1)]
+    assert updated == [artworks[3].id]
+    assert db.session.get(Tag, tag.id).artwork_count == 4
+
+
+def test_bulk_rejects_non_object_json(app):
+    response = app.test_client().post('/bulk/artworks/tags/', json=[1, 2])
+    assert response.status_code == 400
+
+
+def indexed_ids(entity):
+    statement = db.text('SELECT entity_id FROM search_fts WHERE entity = :entity')
+    return set(db.session.scalars(statement, {'entity': entity}))
+
+
+def tagged_artworks(artwork_type, count):
+    tag = Tag(name='oil')
+    artworks = [Artwork(name=str(i), type_id=artwork_type.id) for i in range(count)]
+    db.session.add_all([tag, *artworks])
+    db.session.flush()
+    for artwork in artworks:
+        artwork.add_tag(tag)
+    db.session.commit()
+    return tag, [a.id for a in artworks]
+
+
+def test_soft_delete_artworks_by_id(app, artwork_type):
+    tag, ids = tagged_artworks(artwork_type, 3)
+    response = app.test_client().post('/bulk/artwork/delete/', json={'id': ids[:2]})
+    assert response.get_json() == {'artworks': 2}
+    assert indexed_ids('artwork') == {ids[2]}
+    assert db.session.get(Tag, tag.id).artwork_count == 1
+
+
+def test_soft_delete_artworks_by_filter(app, artwork_type):
+    tag, ids = tagged_artworks(artwork_type, 3)
+    response = app.test_client().post('/bulk/artwork/delete/',
+                                      json={'type_id': [artwork_type.id]})
+    assert response.get_json() == {'artworks': 3}
+    assert indexed_ids('artwork') == set()
+    assert db.session.get(Tag, tag.id).artwork_count == 0
+
+
+def test_soft_delete_clients(app):
+    clients = [Client(name=name, phone=str(i)) for i, name in enumerate(['Ann', 'Bob', 'Amy'])]
+    db.session.add_all(clients)
+    db.session.commit()
+    ids = [c.id for c in clients]
+    response = app.test_client().post('/bulk/client/delete/', json={'id': ids[1]})
+    assert response.get_json() == {'clients': 1}
+    assert indexed_ids('client') == {ids[0], ids[2]}
+    selection = bulk.selection(Client, criteria=[Client.name.startswith('A')])
+    assert bulk.soft_delete('client', selection) == {'clients': 2}
+    assert indexed_ids('client') == set()
+    assert Client.query.filter_by(no_active=False).count() == 0
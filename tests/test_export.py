@@ -0,0 +1,14 @@
+from app import db
+from app.gallery.models import Client
+
+
+def test_export_clients(app):
+    db.session.add_all([Client(name='Ann', phone='1'), Client(name='Bob', phone='2')])
+    db.session.commit()
+    client = app.test_client()
+    response = client.get('/export/clients.csv?batch_size=1')
+    assert response.status_code == 200
+    assert len(response.get_data(as_text=True).splitlines()) == 3
+    for batch_size in (0, -1):
+        response = client.get('/export/clients.csv?batch_size={}'.format(batch_size))
+        assert response.status_code == 400
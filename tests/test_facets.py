@@ -0,0 +1,16 @@
+from app import db
+from app.gallery import search
+from app.gallery.models import Artwork, Feature, FeaturesValue
+
+
+def test_feature_facets_top_values(artwork_type):
+    feature = Feature(name='Colour', type_id=artwork_type.id)
+    artworks = [Artwork(name=str(i), type_id=artwork_type.id) for i in range(6)]
+    db.session.add_all([feature, *artworks])
+    db.session.flush()
+    colours = ['red', 'red', 'red', 'blue', 'blue', 'green']
+    for artwork, colour in zip(artworks, colours):
+        db.session.add(FeaturesValue(artwork_id=artwork.id, feature_id=feature.id, value=colour))
+    db.session.commit()
+    assert search.feature_facets([], limit=2) == [(feature, [('red', 3), ('blue', 2)])]
+    assert search.feature_facets([(feature.id, 'blue')]) == [(feature, [('blue', 2)])]
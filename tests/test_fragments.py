@@ -0,0 +1,30 @@
+from app import cache, db
+from app.gallery import fragments
+from app.gallery.models import Artwork, Feature
+
+
+def cached_artwork(artwork_type):
+    artwork = Artwork(name='a', type_id=artwork_type.id)
+    db.session.add(artwork)
+    db.session.commit()
+    keys = fragments.artwork_keys(artwork.id, artwork.timestamp_update)
+    cache.set_many({key: 'html' for key in keys})
+    return keys
+
+
+def test_new_feature_invalidates_after_commit(artwork_type):
+    keys = cached_artwork(artwork_type)
+    db.session.add(Feature(name='Size', type_id=artwork_type.id))
+    db.session.flush()
+    assert cache.get(keys[1]) == 'html'
+    db.session.commit()
+    assert cache.get(keys[1]) is None
+
+
+def test_rollback_keeps_fragments(artwork_type):
+    keys = cached_artwork(artwork_type)
+    db.session.add(Feature(name='Size', type_id=artwork_type.id))
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert cache.get_many(*keys) == ['html', 'html']
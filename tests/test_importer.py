@@ -0,0 +1,28 @@
+import csv
+
+from app.gallery.importer import Importer
+from app.gallery.models import Artwork, Feature, FeaturesValue, Tag
+
+
+def write_manifest(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_import_features(app, tmp_path):
+    manifest = str(tmp_path / 'manifest.csv')
+    write_manifest(manifest, [
+        {'name': 'Dawn', 'type': 'Painting', 'tags': 'oil;sea', 'feature:Colour': 'blue'},
+        {'name': 'Dusk', 'type': 'Painting', 'tags': 'oil', 'feature:Colour': 'red'},
+        {'name': 'Noon', 'type': 'Painting', 'tags': '', 'feature:Colour': ''},
+    ])
+    importer = Importer(manifest, str(tmp_path), batch_size=2)
+    stats = importer.run()
+    assert stats['artworks'] == 3
+    colour = Feature.query.filter_by(name='Colour').one()
+    values = {v.artwork.name: v.value for v in FeaturesValue.query.filter_by(feature_id=colour.id)}
+    assert values == {'Dawn': 'blue', 'Dusk': 'red'}
+    assert {t.name: t.artwork_count for t in Tag.query} == {'oil': 2, 'sea': 1}
+    assert Artwork.query.count() == 3
@@ -0,0 +1,19 @@
+from app import db
+from app.gallery import bulk, search
+from app.gallery.models import Client
+
+
+def indexed_ids(entity):
+    statement = db.text('SELECT entity_id FROM search_fts WHERE entity = :entity')
+    return set(db.session.scalars(statement, {'entity': entity}))
+
+
+def test_remove_selection(app):
+    clients = [Client(name='Client {}'.format(i), phone=str(i)) for i in range(4)]
+    db.session.add_all(clients)
+    db.session.commit()
+    ids = [c.id for c in clients]
+    connection = db.session.connection()
+    assert search.remove_selection(connection, 'client', ids[:1]) == 1
+    assert search.remove_selection(connection, 'client', bulk.selection(Client, ids[1:3])) == 2
+    assert indexed_ids('client') == {ids[3]}
@@ -0,0 +1,31 @@
+import io
+
+from PIL import Image
+
+from app import db
+from app.gallery import storage
+from app.gallery.models import Artwork, Attachment
+
+
+def test_media_file_serves_only_attachment_objects(app, artwork_type):
+    artwork = Artwork(name='a', type_id=artwork_type.id)
+    db.session.add(artwork)
+    db.session.flush()
+    attachment = Attachment(artwork_id=artwork.id, name='attachment_1_abc.jpg', path='test')
+    db.session.add(attachment)
+    source = io.BytesIO()
+    Image.new('RGB', (1000, 800)).save(source, 'JPEG')
+    source.seek(0)
+    attachment.aws_upload_fileobj(io.BytesIO(source.getvalue()))
+    attachment.create_variants(source)
+    storage.upload_many('test', {'secret.txt': io.BytesIO(b'secret')})
+    storage.upload_many('other', {'attachment_1_abc.jpg': io.BytesIO(b'x')})
+    db.session.commit()
+    client = app.test_client()
+    for key in attachment.object_keys:
+        assert client.get('/media/test/' + key).status_code == 200
+    assert client.get('/media/test/secret.txt').status_code == 404
+    assert client.get('/media/other/attachment_1_abc.jpg').status_code == 404
+    attachment.no_active = True
+    db.session.commit()
+    assert client.get('/media/test/attachment_1_abc.jpg').status_code == 404
@@ -0,0 +1,57 @@
+from app import db
+from app.gallery.models import Artwork, Tag
+
+
+def create_tagged(artwork_type, names, tags):
+    artworks = [Artwork(name=name, type_id=artwork_type.id) for name in names]
+    db.session.add_all(artworks)
+    db.session.flush()
+    for artwork in artworks:
+        for tag in tags:
+            artwork.add_tag(tag)
+    db.session.commit()
+    return artworks
+
+
+def tag_counts():
+    db.session.expire_all()
+    return dict(db.session.query(Tag.id, Tag.artwork_count))
+
+
+def assert_counts_match_recount():
+    counts = tag_counts()
+    Tag.recount()
+    assert tag_counts() == counts
+
+
+def test_add_tag_counts(artwork_type):
+    tags = [Tag(name='oil'), Tag(name='landscape')]
+    db.session.add_all(tags)
+    db.session.flush()
+    create_tagged(artwork_type, ['a', 'b'], tags)
+    assert tag_counts() == {tags[0].id: 2, tags[1].id: 2}
+    assert_counts_match_recount()
+
+
+def test_delete_artwork_releases_tags(artwork_type):
+    tags = [Tag(name='oil'), Tag(name='landscape')]
+    db.session.add_all(tags)
+    db.session.flush()
+    artworks = create_tagged(artwork_type, ['a', 'b'], tags)
+    artwork_id = artworks[0].id
+    db.session.remove()
+    db.session.delete(db.session.get(Artwork, artwork_id))
+    db.session.commit()
+    assert set(tag_counts().values()) == {1}
+    assert_counts_match_recount()
+
+
+def test_delete_tag_releases_count(artwork_type):
+    tag = Tag(name='oil')
+    db.session.add(tag)
+    db.session.flush()
+    artworks = create_tagged(artwork_type, ['a', 'b'], [tag])
+    artworks[0].delete_tag(tag)
+    db.session.commit()
+    assert tag_counts() == {tag.id: 1}
+    assert_counts_match_recount()
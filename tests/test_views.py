@@ -0,0 +1,25 @@
+from app import db
+from app.gallery.models import Artwork, Feature, FeaturesValue
+
+
+def test_index_cards_without_attachments(app, artwork_type):
+    app.config['SQL_PROFILER_SAMPLE_RATE'] = 1.0
+    db.session.add_all([Artwork(name=str(i), type_id=artwork_type.id) for i in range(20)])
+    db.session.commit()
+    response = app.test_client().get('/index/')
+    assert response.status_code == 200
+    assert int(response.headers['X-SQL-Queries']) <= 3
+
+
+def test_features_value_create(app, artwork_type):
+    feature = Feature(name='Colour', type_id=artwork_type.id)
+    artworks = [Artwork(name=str(i), type_id=artwork_type.id) for i in range(2)]
+    db.session.add_all([feature, *artworks])
+    db.session.commit()
+    client = app.test_client()
+    for artwork in artworks:
+        response = client.post('/features/{}/value/{}'.format(feature.id, artwork.id),
+                               data={'value': 'red'})
+        assert response.status_code == 302
+    values = FeaturesValue.query.order_by(FeaturesValue.id).all()
+    assert [(v.artwork_id, v.value) for v in values] == [(a.id, 'red') for a in artworks]